@@ -6,28 +6,28 @@ import streamlit as st
 import serpapi
 
 # Function to check and install packages if they don't exist
-def install_package(package):
+def install_package(package, module=None):
     try:
-        spec = importlib.util.find_spec(package.split('>=')[0].split('==')[0])
+        spec = importlib.util.find_spec(module or package.split('>=')[0].split('==')[0])
         if spec is None:
             print(f"Installing {package}...")
             subprocess.check_call([sys.executable, "-m", "pip", "install", package])
     except Exception as e:
         print(f"Error installing {package}: {str(e)}")
 
-# List of required packages
+# List of required packages and the module each one provides
 required_packages = [
-    "streamlit>=1.31.0",
-    "openai>=1.12.0",
-    "python-dotenv>=1.0.0",
-    "numpy>=1.26.0",
-    "pandas>=2.1.0",
-    "google-search-results>=2.4.2"  # SerpAPI package
+    ("streamlit>=1.31.0", "streamlit"),
+    ("openai>=1.12.0", "openai"),
+    ("python-dotenv>=1.0.0", "dotenv"),
+    ("numpy>=1.26.0", "numpy"),
+    ("pandas>=2.1.0", "pandas"),
+    ("google-search-results>=2.4.2", "serpapi")  # SerpAPI package
 ]
 
-# Install all required packages
-for package in required_packages:
-    install_package(package)
+# Install all required packages (checked by module name so reruns don't call pip)
+for package, module in required_packages:
+    install_package(package, module)
 
 # Now import the required packages
 import streamlit as st
@@ -36,7 +36,13 @@ from dotenv import load_dotenv
 import datetime
 import time
 import json
+import hashlib
+import secrets
 from serpapi import GoogleSearch  # For real web search capabilities
+from prefetch import SearchCache, PrefetchBudget, Prefetcher
+from shared_state import connect, ConversationStore, InProcessStore, SessionTokens
+from prompts import build_messages, estimate_tokens, prompt_cache_usage
+from session_memory import MessageLog, TerminalBuffer, MemoryRegistry
 
 # Streamlit page configuration (must be the first Streamlit command)
 st.set_page_config(
@@ -50,12 +56,14 @@ st.set_page_config(
 load_dotenv()
 
 # Configure API keys from environment variables or Streamlit secrets
+# The OpenAI key is only a default; each session keeps its own key in session state
+default_openai_api_key = None
 try:
     # Configure OpenAI API Key
     if hasattr(st, 'secrets') and "OPENAI_API_KEY" in st.secrets and st.secrets["OPENAI_API_KEY"]:
-        openai.api_key = st.secrets["OPENAI_API_KEY"]
+        default_openai_api_key = st.secrets["OPENAI_API_KEY"]
     elif os.getenv("OPENAI_API_KEY"):
-        openai.api_key = os.getenv("OPENAI_API_KEY")
+        default_openai_api_key = os.getenv("OPENAI_API_KEY")
     else:
         # Will be handled in the UI
         pass
@@ -154,16 +162,219 @@ def perform_web_search(query, num_results=5):
             "organic_results": []
         }
 
+# Speculative prefetch settings for "People also ask" follow-ups (opt-in)
+PREFETCH_ENABLED = os.getenv("WEBMIND_PREFETCH", "false").lower() in ("1", "true", "yes")
+PREFETCH_TOP_K = int(os.getenv("WEBMIND_PREFETCH_TOP_K", "2"))
+PREFETCH_DRAFTS = os.getenv("WEBMIND_PREFETCH_DRAFTS", "false").lower() in ("1", "true", "yes")
+PREFETCH_MAX_SEARCHES_PER_HOUR = int(os.getenv("WEBMIND_PREFETCH_MAX_SEARCHES_PER_HOUR", "60"))
+PREFETCH_MAX_DRAFT_TOKENS_PER_HOUR = int(os.getenv("WEBMIND_PREFETCH_MAX_DRAFT_TOKENS_PER_HOUR", "20000"))
+PREFETCH_DRAFT_MAX_TOKENS = int(os.getenv("WEBMIND_PREFETCH_DRAFT_MAX_TOKENS", "400"))
+
+# Per-session and process-wide memory budgets for chat and terminal history
+SESSION_MEMORY_BUDGET = int(os.getenv("WEBMIND_SESSION_MEMORY_BUDGET", str(256 * 1024)))
+GLOBAL_MEMORY_BUDGET = int(os.getenv("WEBMIND_GLOBAL_MEMORY_BUDGET", str(256 * 1024 * 1024)))
+SESSION_HOT_MESSAGES = int(os.getenv("WEBMIND_SESSION_HOT_MESSAGES", "8"))
+TERMINAL_MAX_LINES = int(os.getenv("WEBMIND_TERMINAL_MAX_LINES", "500"))
+# Offloading is opt-in: set a directory to keep the oldest history on disk
+# (as plaintext, in owner-only per-session subdirectories) instead of dropping it
+SESSION_OFFLOAD_DIR = os.getenv("WEBMIND_SESSION_OFFLOAD_DIR") or None
+
+@st.cache_resource
+def get_shared_store():
+    """
+    Return the state store shared by all replicas.
+
+    Set WEBMIND_STATE_URL to a redis:// URL to share caches, quotas and
+    sessions between replicas; by default an in-process store is used.
+    """
+    return connect(os.getenv("WEBMIND_STATE_URL"))
+
+@st.cache_resource
+def get_conversation_store():
+    """
+    Return the store for per-session conversation state, or None if sessions
+    are not shared.
+
+    With the in-process store no other replica could resume a session, so
+    keeping a second copy of every conversation would only cost memory.
+    """
+    store = get_shared_store()
+    if isinstance(store, InProcessStore):
+        return None
+    return ConversationStore(store)
+
+@st.cache_resource
+def get_session_tokens():
+    """
+    Return the signer for session tokens in ?sid= URLs.
+
+    Replicas only accept each other's tokens if they share
+    WEBMIND_SESSION_SECRET; without it each process signs with its own
+    random secret and sessions can only be resumed on the same process.
+    """
+    return SessionTokens(os.getenv("WEBMIND_SESSION_SECRET") or secrets.token_hex(32))
+
+def get_openai_client(api_key):
+    """
+    Return this session's OpenAI client for an API key.
+
+    The client is kept in session state next to the key rather than in a
+    process-wide cache, so a user's credential is dropped with their session
+    and never shared with another one.
+    """
+    client = st.session_state.get("openai_client")
+    if client is None or client.api_key != api_key:
+        client = openai.OpenAI(api_key=api_key)
+        st.session_state.openai_client = client
+    return client
+
+@st.cache_resource
+def get_search_cache():
+    """Return the search cache shared by every session and replica."""
+    return SearchCache(get_shared_store(), ttl_seconds=int(os.getenv("WEBMIND_SEARCH_CACHE_TTL", "900")))
+
+@st.cache_resource
+def get_prefetcher():
+    """Return the background prefetcher for this process."""
+    budget = PrefetchBudget(
+        get_shared_store(),
+        max_searches_per_hour=PREFETCH_MAX_SEARCHES_PER_HOUR,
+        max_draft_tokens_per_hour=PREFETCH_MAX_DRAFT_TOKENS_PER_HOUR
+    )
+    return Prefetcher(get_search_cache(), perform_web_search, budget, top_k=PREFETCH_TOP_K)
+
+def cached_web_search(query, session_id, history_context):
+    """
+    Look up a query in the search cache before falling back to a live search.
+
+    Args:
+        query (str): The search query
+        session_id (str): Session asking; only its own prefetched drafts are returned
+        history_context (str): history_fingerprint of the conversation before this
+            query; drafts written for a different history are not returned
+
+    Returns:
+        tuple: (search results dict, precomputed draft answer or None)
+    """
+    cache = get_search_cache()
+    entry = cache.get(query)
+    if entry is not None:
+        return entry["results"], cache.take_draft(session_id, query, history_context)
+
+    results = perform_web_search(query)
+    if "error" not in results:
+        cache.put(query, results)
+    return results, None
+
+def make_draft_fns(client, history, username, current_date):
+    """
+    Create the functions that precompute a draft answer for a prefetched question.
+
+    The draft is written for one session: it uses that session's client,
+    conversation history and prompt layout, as if the question were its next
+    turn, with a tighter token cap.
+
+    Returns:
+        tuple: (build_draft(question, results) -> messages,
+        complete_draft(messages, max_tokens) -> (text, billed tokens))
+    """
+    def build_draft(question, search_results):
+        return build_messages(history + [{"role": "user", "content": question}], username, current_date, search_results)
+
+    def complete_draft(messages, max_tokens):
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.7,
+        )
+        tokens = response.usage.total_tokens if response.usage else estimate_tokens(messages) + max_tokens
+        choice = response.choices[0]
+        # A draft cut off at the tighter cap must not be served as a final answer
+        if choice.finish_reason == "length":
+            return None, tokens
+        return choice.message.content, tokens
+
+    return build_draft, complete_draft
+
+def history_fingerprint(messages):
+    """
+    Identify a chat history by its length and last message.
+
+    Drafts are keyed by the fingerprint taken when they were scheduled, so a
+    draft is no longer served once other turns have been added to the history.
+    """
+    last = messages.last()
+    digest = hashlib.sha256(last.content.encode("utf-8")).hexdigest()[:16] if last is not None else ""
+    return f"{len(messages)}-{digest}"
+
+@st.cache_resource
+def get_memory_registry():
+    """Return the registry enforcing the global memory budget for this process."""
+    return MemoryRegistry(global_budget_bytes=GLOBAL_MEMORY_BUDGET)
+
+def new_message_log(messages=None):
+    """Create a compact chat history bound to the configured memory budgets."""
+    return MessageLog(
+        messages,
+        hot_messages=SESSION_HOT_MESSAGES,
+        session_budget_bytes=SESSION_MEMORY_BUDGET,
+        offload_dir=SESSION_OFFLOAD_DIR,
+        registry=get_memory_registry()
+    )
+
+def persist_session(action, *args):
+    """
+    Apply one update to this session's shared conversation state.
+
+    Args:
+        action (str): ConversationStore method, e.g. "append_messages" or "reset"
+        *args: Arguments after the session id
+    """
+    conversation_store = get_conversation_store()
+    if conversation_store is not None:
+        getattr(conversation_store, action)(st.session_state.session_id, *args)
+
+# Identify the session by a signed token in the URL so any replica can pick it up.
+# The token is a bearer credential: anyone with the full URL can resume the session.
+if "session_id" not in st.session_state:
+    session_id = get_session_tokens().verify(st.query_params.get("sid"))
+
+    # Restore conversation state saved by this or another replica, but never
+    # adopt a client-supplied id that has nothing stored under it
+    conversation_store = get_conversation_store()
+    stored = conversation_store.load(session_id) if session_id and conversation_store else {}
+    if not stored:
+        session_id, token = get_session_tokens().issue()
+        st.query_params["sid"] = token
+    st.session_state.session_id = session_id
+
+    if "username" in stored:
+        st.session_state.username = stored["username"]
+    if "messages" in stored:
+        st.session_state.messages = new_message_log(stored["messages"])
+    if "terminal_history" in stored:
+        st.session_state.terminal_history = TerminalBuffer(stored["terminal_history"], max_lines=TERMINAL_MAX_LINES)
+
 # Initialize session state variables if they don't exist
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = new_message_log()
 
 if "username" not in st.session_state:
     st.session_state.username = None
 
+if "prompt_cache_stats" not in st.session_state:
+    st.session_state.prompt_cache_stats = []
+
+if "prefetch_enabled" not in st.session_state:
+    st.session_state.prefetch_enabled = PREFETCH_ENABLED
+
 # Set up API key session state
+if "openai_api_key" not in st.session_state:
+    st.session_state.openai_api_key = default_openai_api_key
+
 if "api_key_configured" not in st.session_state:
-    st.session_state.api_key_configured = openai.api_key is not None
+    st.session_state.api_key_configured = st.session_state.openai_api_key is not None
 
 # Sidebar navigation
 with st.sidebar:
@@ -174,10 +385,10 @@ with st.sidebar:
         with st.expander("Configure OpenAI API Key", expanded=True):
             api_key = st.text_input("Enter your OpenAI API Key:", type="password")
             if st.button("Save API Key") and api_key:
-                openai.api_key = api_key
+                st.session_state.openai_api_key = api_key
                 st.session_state.api_key_configured = True
                 st.success("API key configured successfully!")
-                st.experimental_rerun()
+                st.rerun()
 
     # Username input for first-time users
     if st.session_state.username is None:
@@ -187,14 +398,17 @@ with st.sidebar:
 
             if submit_button and input_username:
                 st.session_state.username = input_username
+                persist_session("set_username", input_username)
                 st.success(f"Welcome, {input_username}!")
-                st.experimental_rerun()
+                st.rerun()
     else:
         st.write(f"Logged in as: **{st.session_state.username}**")
         if st.button("Logout"):
             st.session_state.username = None
-            st.session_state.messages = []
-            st.experimental_rerun()
+            st.session_state.messages.close()
+            st.session_state.messages = new_message_log()
+            persist_session("reset", "username", "messages")
+            st.rerun()
 
     # Navigation menu
     st.header("Navigation")
@@ -231,13 +445,15 @@ else:
 
         # Display chat messages
         for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+            with st.chat_message(message.role):
+                st.markdown(message.content)
 
         # Chat input
         if prompt := st.chat_input("Type your message here..."):
             # Add user message to chat history
-            st.session_state.messages.append({"role": "user", "content": prompt})
+            draft_context = history_fingerprint(st.session_state.messages)
+            st.session_state.messages.append("user", prompt)
+            persist_session("append_messages", {"role": "user", "content": prompt})
 
             # Display user message
             with st.chat_message("user"):
@@ -249,7 +465,7 @@ else:
                 message_placeholder.markdown("Thinking...")
 
                 try:
-                    if not openai.api_key:
+                    if not st.session_state.openai_api_key:
                         raise ValueError("OpenAI API key is not configured. Please add your API key in the sidebar or Settings page.")
 
                     # Current date for context
@@ -264,85 +480,77 @@ else:
 
                     # Perform web search for questions that might need real-time info
                     search_results = None
+                    draft_answer = None
                     if needs_search:
                         with st.spinner("Searching the web..."):
-                            search_results = perform_web_search(prompt)
+                            search_results, draft_answer = cached_web_search(prompt, st.session_state.session_id, draft_context)
 
                             # Check if search had an error
                             if "error" in search_results and not search_results.get("organic_results"):
                                 st.warning(f"Web search error: {search_results['error']}. Using AI knowledge only.")
                                 search_results = None
 
-                    # Enhanced system prompt with web search capabilities
-                    system_prompt = f"""You are WebMind, an advanced AI assistant with real web search capabilities talking to {st.session_state.username}. Today's date is {current_date}.
-
-When answering questions:
-1. Use the provided search results (if available) to give accurate, up-to-date information.
-2. Include relevant facts, statistics, and citations when appropriate using [Source: Website] format.
-3. For coding questions, provide modern, best-practice code examples.
-4. Structure complex responses with clear headings and organized information.
-5. If you're unsure about some information, acknowledge this rather than making up facts.
-
-Your goal is to provide the most helpful, accurate, and comprehensive response possible."""
-
-                    # Prepare the messages for OpenAI
-                    messages = [{"role": "system", "content": system_prompt}]
-
-                    # Add search results as a system message if available
-                    if search_results:
-                        search_content = "Here are the web search results for your query:\n\n"
-
-                        # Add answer box/featured snippet if available
-                        if search_results.get("answer_box"):
-                            ab = search_results["answer_box"]
-                            search_content += f"FEATURED ANSWER: {ab.get('title', '')}\n{ab.get('answer', '')}\n"
-                            if ab.get('source'):
-                                search_content += f"[Source: {ab.get('source')}]\n\n"
-
-                        # Add knowledge graph if available
-                        if search_results.get("knowledge_graph"):
-                            kg = search_results["knowledge_graph"]
-                            search_content += f"KNOWLEDGE PANEL: {kg.get('title', '')} - {kg.get('type', '')}\n"
-                            search_content += f"{kg.get('description', '')}\n\n"
-
-                        # Add organic search results
-                        if search_results.get("organic_results"):
-                            search_content += "SEARCH RESULTS:\n"
-                            for i, result in enumerate(search_results["organic_results"], 1):
-                                search_content += f"{i}. {result['title']}\n"
-                                search_content += f"   {result['snippet']}\n"
-                                search_content += f"   [Source: {result['source']}]\n\n"
-
-                        # Add related questions if available
-                        if search_results.get("related_questions"):
-                            search_content += "PEOPLE ALSO ASK:\n"
-                            for i, question in enumerate(search_results["related_questions"], 1):
-                                search_content += f"{i}. {question['question']}\n"
-                                search_content += f"   {question['answer']}\n"
-                                if question.get('source'):
-                                    search_content += f"   [Source: {question['source']}]\n"
-
-                        messages.append({"role": "system", "content": search_content})
-
-                    # Add conversation history
-                    messages.extend([{"role": m["role"], "content": m["content"]} for m in st.session_state.messages])
-
-                    # Send request to OpenAI API
-                    response = openai.chat.completions.create(
-                        model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
-                        messages=messages,
-                        max_tokens=1500,  # Increased to allow for more detailed responses
-                        temperature=0.7,
+                    # Prepare the messages for OpenAI: static instructions and history first
+                    # so the prefix stays cacheable, then user, date and search context
+                    messages = build_messages(
+                        st.session_state.messages,
+                        st.session_state.username,
+                        current_date,
+                        search_results
                     )
 
-                    # Extract response text
-                    response_text = response.choices[0].message.content
+                    # Serve a prefetched draft answer if this follow-up was anticipated
+                    if draft_answer:
+                        response_text = draft_answer
+                        # Keep one entry per assistant turn so the Settings list lines up with the chat
+                        cache_usage = {"prompt_tokens": 0, "cached_tokens": 0, "cache_hit_ratio": 0.0, "draft": True}
+                        st.session_state.prompt_cache_stats.append(cache_usage)
+                    else:
+                        # Send request to OpenAI API
+                        client = get_openai_client(st.session_state.openai_api_key)
+                        response = client.chat.completions.create(
+                            model="gpt-4o",  # the newest OpenAI model is "gpt-4o" which was released May 13, 2024. do not change this unless explicitly requested by the user
+                            messages=messages,
+                            max_tokens=1500,  # Increased to allow for more detailed responses
+                            temperature=0.7,
+                        )
+
+                        # Extract response text
+                        response_text = response.choices[0].message.content
+
+                        # Record how much of the prompt was served from the provider's cache
+                        cache_usage = prompt_cache_usage(response.usage)
+                        st.session_state.prompt_cache_stats.append(cache_usage)
 
                     # Update AI message
                     message_placeholder.markdown(response_text)
+                    if not draft_answer and cache_usage["prompt_tokens"]:
+                        st.caption(f"Prompt cache: {cache_usage['cached_tokens']} of "
+                                   f"{cache_usage['prompt_tokens']} prompt tokens cached "
+                                   f"({cache_usage['cache_hit_ratio']:.0%})")
 
                     # Add assistant response to chat history
-                    st.session_state.messages.append({"role": "assistant", "content": response_text})
+                    st.session_state.messages.append("assistant", response_text)
+                    persist_session("append_messages", {"role": "assistant", "content": response_text})
+
+                    # Speculatively prefetch the likely follow-up questions
+                    if st.session_state.prefetch_enabled and search_results:
+                        build_draft = complete_draft = None
+                        if PREFETCH_DRAFTS:
+                            build_draft, complete_draft = make_draft_fns(
+                                get_openai_client(st.session_state.openai_api_key),
+                                [m.to_dict() for m in st.session_state.messages],
+                                st.session_state.username,
+                                current_date
+                            )
+                        get_prefetcher().schedule(
+                            search_results,
+                            owner=st.session_state.session_id,
+                            build_draft=build_draft,
+                            complete_draft=complete_draft,
+                            draft_max_tokens=PREFETCH_DRAFT_MAX_TOKENS,
+                            context=history_fingerprint(st.session_state.messages)
+                        )
 
                 except ValueError as e:
                     # Handle missing API key
@@ -468,7 +676,7 @@ LIMIT 10;"""
 
         with col1:
             st.markdown("### Code Editor")
-            code = st.text_area("", value=default_code[language], height=400)
+            code = st.text_area("Code", value=default_code[language], height=400, label_visibility="collapsed")
             run_button = st.button("Run Code")
 
         with col2:
@@ -493,21 +701,22 @@ LIMIT 10;"""
 
         # Terminal history display
         if "terminal_history" not in st.session_state:
-            st.session_state.terminal_history = [
-                {"output": "\x1b[1;32mWelcome to the Replit-like Terminal!\x1b[0m"},
-                {"output": "This is a simulated terminal for demonstration purposes."},
-                {"output": "Try typing some commands like:"},
-                {"output": "- help: Show available commands"},
-                {"output": "- ls: List files in current directory"},
-                {"output": "- echo <text>: Display text"},
-                {"output": "- clear: Clear the terminal"},
-                {"output": "- date: Show current date and time"},
-                {"output": "- whoami: Show current user"},
-                {"output": ""}
-            ]
+            st.session_state.terminal_history = TerminalBuffer([
+                "\x1b[1;32mWelcome to the Replit-like Terminal!\x1b[0m",
+                "This is a simulated terminal for demonstration purposes.",
+                "Try typing some commands like:",
+                "- help: Show available commands",
+                "- ls: List files in current directory",
+                "- echo <text>: Display text",
+                "- clear: Clear the terminal",
+                "- date: Show current date and time",
+                "- whoami: Show current user",
+                ""
+            ], max_lines=TERMINAL_MAX_LINES)
+            persist_session("append_terminal", list(st.session_state.terminal_history), TERMINAL_MAX_LINES)
 
         # Display terminal history in a scrollable area
-        terminal_display = st.code("\n".join([entry["output"] for entry in st.session_state.terminal_history]), language="bash")
+        terminal_display = st.code("\n".join(st.session_state.terminal_history), language="bash")
 
         # Terminal input
         with st.form("terminal_input", clear_on_submit=True):
@@ -523,7 +732,8 @@ LIMIT 10;"""
                     output = "Available commands:\n- help - Show this help message\n- clear - Clear the terminal\n- echo <text> - Display text\n- ls - List files (simulated)\n- date - Show current date and time\n- whoami - Show current user"
 
                 elif primary_cmd == "clear":
-                    st.session_state.terminal_history = []
+                    st.session_state.terminal_history.clear()
+                    persist_session("reset", "terminal_history")
                     output = ""
 
                 elif primary_cmd == "echo":
@@ -542,11 +752,12 @@ LIMIT 10;"""
                     output = f"Command not found: {primary_cmd}\nType 'help' to see available commands"
 
                 # Add command and output to history
-                st.session_state.terminal_history.append({"output": f"$ {cmd}"})
-                st.session_state.terminal_history.append({"output": output})
+                st.session_state.terminal_history.append(f"$ {cmd}")
+                st.session_state.terminal_history.append(output)
+                persist_session("append_terminal", [f"$ {cmd}", output], TERMINAL_MAX_LINES)
 
                 # Rerun to update terminal display
-                st.experimental_rerun()
+                st.rerun()
 
     elif page == "Version Control":
         st.header("🔄 Version Control")
@@ -650,6 +861,7 @@ LIMIT 10;"""
                 if submit_profile:
                     if new_username != current_username:
                         st.session_state.username = new_username
+                        persist_session("set_username", new_username)
                         st.success(f"Username updated to {new_username}!")
                     st.success("Profile settings updated successfully!")
 
@@ -678,15 +890,44 @@ LIMIT 10;"""
                 # Local AI fallback options
                 use_local_fallback = st.checkbox("Use local AI as fallback if OpenAI is unavailable", value=True)
 
+                # Speculative prefetch of related questions
+                prefetch_enabled = st.checkbox("Prefetch \"People also ask\" follow-ups in the background",
+                                               value=st.session_state.prefetch_enabled)
+
                 submit_api = st.form_submit_button("Save API Settings")
 
                 if submit_api:
                     if new_api_key and new_api_key != "••••••••":
-                        openai.api_key = new_api_key
+                        st.session_state.openai_api_key = new_api_key
                         st.session_state.api_key_configured = True
+                    st.session_state.prefetch_enabled = prefetch_enabled
 
                     st.success("API settings updated successfully!")
 
+            # Provider-side prompt cache hit ratio for each turn in this session
+            with st.expander("Prompt cache"):
+                if st.session_state.prompt_cache_stats:
+                    for turn, usage in enumerate(st.session_state.prompt_cache_stats, 1):
+                        if usage.get("draft"):
+                            st.markdown(f"**Turn {turn}:** answered from a prefetched draft (no prompt sent)")
+                        else:
+                            st.markdown(f"**Turn {turn}:** {usage['cached_tokens']} / {usage['prompt_tokens']} "
+                                        f"prompt tokens cached ({usage['cache_hit_ratio']:.0%})")
+                else:
+                    st.markdown("No chat turns yet.")
+
+            # Prefetch metrics for tuning the number of prefetched questions
+            with st.expander("Prefetch metrics"):
+                stats = get_search_cache().metrics.snapshot()
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Hit rate", f"{stats['hit_rate']:.0%}")
+                col2.metric("Prefetched searches", stats["prefetched_searches"])
+                col3.metric("Wasted searches", stats["wasted_searches"])
+                st.markdown(f"**Top-k:** {PREFETCH_TOP_K} · **Drafts:** {'on' if PREFETCH_DRAFTS else 'off'}")
+                st.markdown(f"**Draft tokens spent (prompt + completion):** {stats['draft_tokens_spent']} "
+                            f"(wasted: {stats['wasted_draft_tokens']}, draft hits: {stats['draft_hits']})")
+                st.markdown(f"**Skipped over budget:** {stats['skipped_over_budget']}")
+
         with theme_tab:
             st.subheader("Display & Theme Settings")
 
@@ -722,33 +963,3 @@ LIMIT 10;"""
                 if submit_theme:
                     st.success("Theme settings updated! Note: Some settings may require a refresh to take full effect.")
                     # Here we would actually apply these settings in a real implementation
-
-import streamlit as st
-
-# Example of using st.rerun()
-if some_condition:
-    # Reset session state variables if needed
-    st.session_state.some_variable = new_value
-    st.rerun()  # Updated method
-
-# Example of manual state reset
-if some_other_condition:
-    # Reset session state variables
-    st.session_state.some_variable = new_value
-    st.stop()  # Stop the script execution
-
-
-
-# Example form submission
-with st.form("my_form"):
-    user_input = st.text_input("Enter some text")
-    submitted = st.form_submit_button("Submit")
-
-    if submitted:  # This is the condition
-        # Process the form data
-        st.session_state.processed_input = user_input
-        st.rerun()  # Rerun the app to reflect changes
-
-# Display the processed input
-if 'processed_input' in st.session_state:
-    st.write("You entered:", st.session_state.processed_input)
@@ -0,0 +1,446 @@
+"""
+Rerun latency and memory benchmark for every page of the app.
+
+Drives app.py headlessly with Streamlit's AppTest harness, with OpenAI and
+SerpAPI replaced by in-process stubs so it runs offline. Each scenario
+scripts a realistic interaction sequence on one page, at several history
+sizes, and records for every rerun its wall time and its traced peak memory
+(allocated above the level before the rerun), plus the memory the session
+holds in its state afterwards (chat and terminal history, caches, widgets).
+
+AppTest compiles app.py afresh on every rerun, which alone peaks at about
+2 MB; a Streamlit server compiles it once. The benchmark shares one script
+cache across reruns like a server does, so the peak reflects the app's own
+work, e.g. decompressing history and building the prompt.
+
+Rerun times are noisy, so every scenario is warmed up before it is timed and
+replayed many times. The baseline is the median of several passes and keeps
+how far those passes spread. Times are also scaled by a fixed CPU calibration
+loop, so a slower or busier machine does not look like a regression. A
+scenario fails when it is slower, or needs more memory, than the baseline
+plus the tolerance and the recorded noise. The noise allowance is capped, so
+by default a limit never exceeds 1.5x the (scaled) baseline, plus a few
+milliseconds or KiB of slack for scenarios whose reruns are that small.
+
+Usage:
+    python benchmarks/rerun_latency.py                     # compare with baseline
+    python benchmarks/rerun_latency.py --update-baseline   # record a new baseline
+"""
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import statistics
+import tracemalloc
+import importlib.machinery
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+APP_PATH = os.path.join(ROOT, "app.py")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rerun_baseline.json")
+HISTORY_SIZES = (0, 50, 200)
+
+
+# Stubs for the external services --------------------------------------------------------
+
+STUB_SEARCH_RESULTS = {
+    "organic_results": [
+        {"title": f"Result {i}", "link": f"https://example.com/{i}",
+         "snippet": "A short snippet describing the page. " * 3, "source": "Example"}
+        for i in range(5)
+    ],
+    "answer_box": {"title": "Answer", "answer": "The featured answer.", "source": "Example"},
+    "related_questions": [
+        {"question": f"Related question {i}?", "answer": "A related answer.", "source": {"name": "Example"}}
+        for i in range(4)
+    ],
+}
+
+STUB_ANSWER = ("## Answer\n\nThis is a stubbed model response with a few paragraphs of text. " * 8 +
+               "\n\n```python\nprint('hello')\n```\n")
+
+
+class _StubCompletions:
+    def create(self, **kwargs):
+        usage = types.SimpleNamespace(
+            prompt_tokens=1200, completion_tokens=300, total_tokens=1500,
+            prompt_tokens_details=types.SimpleNamespace(cached_tokens=1024)
+        )
+        message = types.SimpleNamespace(content=STUB_ANSWER)
+        choice = types.SimpleNamespace(message=message, finish_reason="stop")
+        return types.SimpleNamespace(choices=[choice], usage=usage)
+
+
+class _StubOpenAI:
+    def __init__(self, api_key=None, **kwargs):
+        self.api_key = api_key
+        self.chat = types.SimpleNamespace(completions=_StubCompletions())
+
+
+class _StubGoogleSearch:
+    def __init__(self, params):
+        self.params = params
+
+    def get_dict(self):
+        return dict(STUB_SEARCH_RESULTS)
+
+
+def install_stubs():
+    """Register offline stand-ins for the openai and serpapi modules."""
+    openai_stub = types.ModuleType("openai")
+    openai_stub.__spec__ = importlib.machinery.ModuleSpec("openai", None)
+    openai_stub.api_key = None
+    openai_stub.OpenAI = _StubOpenAI
+    openai_stub.chat = _StubOpenAI().chat
+
+    serpapi_stub = types.ModuleType("serpapi")
+    serpapi_stub.__spec__ = importlib.machinery.ModuleSpec("serpapi", None)
+    serpapi_stub.GoogleSearch = _StubGoogleSearch
+
+    sys.modules["openai"] = openai_stub
+    sys.modules["serpapi"] = serpapi_stub
+
+
+def share_script_cache():
+    """Make every AppTest run reuse one compiled app.py, as a Streamlit server does."""
+    from streamlit.testing.v1 import local_script_runner
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+
+
+# Scenarios -------------------------------------------------------------------------------
+
+def make_history(size):
+    """Build a chat history of the given number of messages."""
+    from session_memory import MessageLog
+    history = MessageLog(session_budget_bytes=2 ** 62)
+    for i in range(size):
+        if i % 2 == 0:
+            history.append("user", f"What is the latest news about topic {i}?")
+        else:
+            history.append("assistant", STUB_ANSWER)
+    return history
+
+
+def make_terminal_history(size):
+    """Build a terminal history of the given number of lines."""
+    from session_memory import TerminalBuffer
+    return TerminalBuffer([f"$ echo line {i}" if i % 2 == 0 else f"line {i}" for i in range(size)])
+
+
+def find_button(at, label):
+    return next(button for button in at.button if button.label == label)
+
+
+def chat_steps(at):
+    yield lambda: at.chat_input[0].set_value("What is the latest Streamlit release?").run()
+    yield lambda: at.chat_input[0].set_value("Write a haiku about caching").run()
+    yield lambda: at.chat_input[0].set_value("How does prompt caching work?").run()
+
+
+def code_playground_steps(at):
+    for language in ("Python", "JavaScript", "SQL"):
+        yield lambda language=language: at.selectbox[0].set_value(language).run()
+        yield lambda: find_button(at, "Run Code").click().run()
+
+
+def terminal_steps(at):
+    for command in ("help", "ls", "echo benchmark", "date", "whoami"):
+        def step(command=command):
+            at.text_input(key="terminal_command").input(command)
+            find_button(at, "Execute").click().run()
+        yield step
+
+
+def version_control_steps(at):
+    yield lambda: at.text_input[0].input("Improve rerun latency").run()
+    yield lambda: at.selectbox[0].set_value("development").run()
+    yield lambda: find_button(at, "Commit Changes").click().run()
+
+
+def settings_steps(at):
+    yield lambda: find_button(at, "Update Profile").click().run()
+    yield lambda: find_button(at, "Save API Settings").click().run()
+    yield lambda: find_button(at, "Apply Theme Settings").click().run()
+
+
+PAGES = {
+    "Chat": chat_steps,
+    "Code Playground": code_playground_steps,
+    "Terminal": terminal_steps,
+    "Version Control": version_control_steps,
+    "Settings": settings_steps,
+}
+
+
+def open_page(page, history_size, timeout):
+    """Start a logged-in session with a history of the given size on a page."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.secrets["OPENAI_API_KEY"] = "sk-benchmark"
+    at.secrets["SERPAPI_API_KEY"] = "benchmark"
+    at.session_state["username"] = "benchmark"
+    at.session_state["messages"] = make_history(history_size)
+    at.session_state["terminal_history"] = make_terminal_history(history_size)
+    at.run()
+    at.sidebar.radio[0].set_value(page).run()
+    return at
+
+
+def session_state_bytes(at):
+    """
+    Approximate the memory held in one session's state.
+
+    Chat history counts what its MessageLog accounts for (offloaded messages
+    are not in memory); every other value is sized recursively.
+    """
+    from session_memory import MessageLog, TerminalBuffer
+    seen = set()
+
+    def size(value):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        total = sys.getsizeof(value)
+        if isinstance(value, MessageLog):
+            total += value.nbytes
+        elif isinstance(value, dict):
+            total += sum(size(key) + size(item) for key, item in value.items())
+        elif isinstance(value, (list, tuple, set, frozenset, TerminalBuffer)):
+            total += sum(size(item) for item in value)
+        return total
+
+    return sum(size(key) + size(value) for key, value in at.session_state.items())
+
+
+def run_scenario(page, history_size, repeats, timeout, trace_memory, warmup=0):
+    """
+    Run one page's interaction sequence and measure every rerun.
+
+    The first warmup replays are run but not recorded, so one-off costs
+    like imports and first-use caches do not end up in the measurements.
+
+    Returns:
+        tuple: (list of rerun times in ms, list of peak KiB allocated above the
+        pre-rerun level, list of session state KiB after each replay, list of
+        app exceptions)
+    """
+    times, peaks, state_kib, errors = [], [], [], []
+    for repeat in range(warmup + repeats):
+        record = repeat >= warmup
+        at = open_page(page, history_size, timeout)
+        errors.extend(str(exception.value) for exception in at.exception)
+        for step in PAGES[page](at):
+            if trace_memory:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            step()
+            elapsed = (time.perf_counter() - start) * 1000
+            if record:
+                times.append(elapsed)
+                if trace_memory:
+                    peaks.append((tracemalloc.get_traced_memory()[1] - before) / 1024)
+            errors.extend(str(exception.value) for exception in at.exception)
+        if record:
+            state_kib.append(session_state_bytes(at) / 1024)
+    return times, peaks, state_kib, errors
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def calibrate(rounds=15):
+    """
+    Time a fixed CPU-bound workload of dict, string and JSON operations.
+
+    Callers keep the fastest of several calls: load on a shared machine only
+    ever slows the loop down, so the minimum tracks its actual speed.
+
+    Returns:
+        float: The fastest of several rounds in ms
+    """
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        data = {}
+        for i in range(20000):
+            data[str(i)] = json.dumps({"role": "user", "content": "x" * (i % 32)})
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+METRICS = ("p50_ms", "p95_ms", "peak_p50_kib", "peak_p95_kib", "state_kib")
+
+
+def run_pass(pages, history_sizes, repeats, memory_repeats, warmup, timeout, verbose=True):
+    """
+    Measure every scenario once.
+
+    Returns:
+        tuple: (dict of scenario name -> METRICS, list of failures)
+    """
+    if verbose:
+        print(f"{'scenario':<30}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+              f"{'peak p50 KiB':>14}{'peak p95 KiB':>14}{'state KiB':>11}")
+    results, failures = {}, []
+    for page in pages:
+        for history_size in history_sizes:
+            name = f"{page} [history={history_size}]"
+            # Timings are taken without tracemalloc, which slows every allocation down
+            times, _, state_kib, errors = run_scenario(page, history_size, repeats, timeout,
+                                                       trace_memory=False, warmup=warmup)
+            tracemalloc.start()
+            _, peaks, _, memory_errors = run_scenario(page, history_size, memory_repeats, timeout,
+                                                      trace_memory=True, warmup=warmup)
+            tracemalloc.stop()
+
+            results[name] = {
+                "p50_ms": statistics.median(times),
+                "p95_ms": percentile(times, 0.95),
+                "peak_p50_kib": statistics.median(peaks),
+                "peak_p95_kib": percentile(peaks, 0.95),
+                "state_kib": max(state_kib),
+            }
+            if verbose:
+                stats = results[name]
+                print(f"{name:<30}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{max(times):>9.1f}"
+                      f"{stats['peak_p50_kib']:>14.0f}{stats['peak_p95_kib']:>14.0f}{stats['state_kib']:>11.1f}")
+            for error in sorted(set(errors + memory_errors)):
+                failures.append(f"{name}: app raised {error}")
+    return results, failures
+
+
+def summarize_passes(passes):
+    """
+    Combine several passes into a baseline: the median of each metric plus
+    its spread (max - min) across passes.
+    """
+    baseline = {}
+    for name in passes[0]:
+        stats = {}
+        for metric in METRICS:
+            values = [results[name][metric] for results in passes]
+            stats[metric] = statistics.median(values)
+            stats[metric + "_spread"] = max(values) - min(values)
+        baseline[name] = stats
+    return baseline
+
+
+# Reporting -------------------------------------------------------------------------------
+
+def compare(results, baseline, calibration_ms, time_tolerance, memory_tolerance, noise_factor, max_noise,
+            min_slack_ms, min_slack_kib):
+    """
+    Return a list of human-readable regressions against the baseline.
+
+    Every limit is the baseline plus the relative tolerance, plus noise_factor
+    times the spread seen between the passes that recorded the baseline. The
+    noise term is capped at max_noise times the baseline so a noisy recording
+    can't hide a real regression. Time limits are also scaled by the
+    calibration ratio and get min_slack_ms on top, since scheduler jitter of
+    a few milliseconds is a large fraction of a short rerun. Memory limits get
+    min_slack_kib on top for the same reason: whether a small rerun's peak
+    includes a garbage collection or a fresh allocator arena swings it by
+    tens of KiB.
+    """
+    speed = calibration_ms / baseline["calibration_ms"]
+    checks = [("p50_ms", time_tolerance, speed, min_slack_ms), ("p95_ms", time_tolerance, speed, min_slack_ms)]
+    checks += [(metric, memory_tolerance, 1, min_slack_kib) for metric in ("peak_p50_kib", "peak_p95_kib", "state_kib")]
+    regressions = []
+    for name, stats in results.items():
+        expected = baseline["scenarios"].get(name)
+        if expected is None:
+            continue
+        for metric, tolerance, scale, slack in checks:
+            noise = min(noise_factor * expected[metric + "_spread"], max_noise * expected[metric])
+            limit = (expected[metric] * (1 + tolerance) + noise) * scale + slack
+            if stats[metric] > limit:
+                detail = f"baseline {expected[metric]:.1f} +{tolerance:.0%} +{noise:.1f} noise"
+                if metric.endswith("_ms"):
+                    detail += f", x{scale:.2f} machine speed, +{slack:g} ms slack"
+                else:
+                    detail += f", +{slack:g} KiB slack"
+                regressions.append(f"{name}: {metric} {stats[metric]:.1f} > {limit:.1f} ({detail})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", nargs="+", choices=list(PAGES), default=list(PAGES))
+    parser.add_argument("--history-sizes", nargs="+", type=int, default=list(HISTORY_SIZES))
+    parser.add_argument("--repeats", type=int, default=20, help="times each interaction sequence is timed")
+    parser.add_argument("--memory-repeats", type=int, default=3,
+                        help="times each interaction sequence is replayed under tracemalloc")
+    parser.add_argument("--warmup", type=int, default=1,
+                        help="unrecorded replays of each interaction sequence before measuring")
+    parser.add_argument("--passes", type=int, default=3,
+                        help="full passes combined into the baseline with --update-baseline")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds allowed for a single rerun")
+    parser.add_argument("--time-tolerance", type=float, default=0.25,
+                        help="allowed relative slowdown of p50/p95 rerun time")
+    parser.add_argument("--noise-factor", type=float, default=3,
+                        help="multiples of the baseline's pass-to-pass spread added to each limit")
+    parser.add_argument("--max-noise", type=float, default=0.25,
+                        help="cap on the noise allowance, relative to the baseline")
+    parser.add_argument("--min-slack-ms", type=float, default=5,
+                        help="absolute slack added to every time limit")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25,
+                        help="allowed relative growth of peak rerun memory and session state")
+    parser.add_argument("--min-slack-kib", type=float, default=64,
+                        help="absolute slack added to every memory limit")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="write results as the new baseline")
+    args = parser.parse_args()
+
+    install_stubs()
+    share_script_cache()
+    # Seeding session state from the main thread makes Streamlit warn on every access
+    from streamlit.runtime.scriptrunner_utils import script_run_context
+    script_run_context._LOGGER.addFilter(lambda record: "missing ScriptRunContext" not in record.getMessage())
+
+    passes = args.passes if args.update_baseline else 1
+    calibrations, runs, failures = [calibrate()], [], []
+    for number in range(passes):
+        if passes > 1:
+            print(f"\nPass {number + 1} of {passes}")
+        results, errors = run_pass(args.pages, args.history_sizes, args.repeats, args.memory_repeats,
+                                   args.warmup, args.timeout)
+        runs.append(results)
+        failures.extend(errors)
+        calibrations.append(calibrate())
+    calibration_ms = min(calibrations)
+    print(f"\nCalibration loop: {calibration_ms:.1f} ms")
+
+    if args.update_baseline:
+        baseline = {"calibration_ms": calibration_ms, "scenarios": summarize_passes(runs)}
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            failures.extend(compare(runs[0], json.load(baseline_file), calibration_ms, args.time_tolerance,
+                                    args.memory_tolerance, args.noise_factor, args.max_noise, args.min_slack_ms,
+                                    args.min_slack_kib))
+    else:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+
+    if failures:
+        print("\nFAILED:")
+        for failure in sorted(set(failures)):
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nOK")
+
+
+if __name__ == "__main__":
+    main()
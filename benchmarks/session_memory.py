@@ -0,0 +1,126 @@
+"""
+Memory benchmark for per-session chat and terminal history.
+
+Builds N simulated sessions with the legacy representation (a dict per
+message, a dict per terminal line, nothing ever bounded) and with the
+compact representation from session_memory.py, and reports traced bytes per
+session for each.
+
+The conversation store rows also write every turn to a ConversationStore the
+way app.py does with a shared Redis. An InProcessStore stands in for the
+Redis server so its copy is traced too; that memory lives on the Redis host in
+a real deployment, and app.py skips the store entirely without Redis.
+
+Usage:
+    python benchmarks/session_memory.py [--sessions 1000] [--turns 20] [--commands 500]
+"""
+import os
+import sys
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from session_memory import MessageLog, TerminalBuffer, MemoryRegistry
+from shared_state import InProcessStore, ConversationStore
+
+WORDS = ("the search results show that python streamlit openai model answer question "
+         "latest news data source cache session user prompt token code example error "
+         "function value result list string memory budget history terminal output").split()
+
+
+def make_text(rng, words):
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def make_conversation(rng, turns):
+    for _ in range(turns):
+        yield "user", make_text(rng, rng.randint(8, 30))
+        yield "assistant", make_text(rng, rng.randint(120, 400))
+
+
+def make_terminal(rng, commands):
+    for _ in range(commands):
+        yield f"$ echo {make_text(rng, 3)}"
+        yield make_text(rng, rng.randint(3, 20))
+
+
+def build_legacy(sessions, turns, commands):
+    rng = random.Random(0)
+    result = []
+    for _ in range(sessions):
+        messages = [{"role": role, "content": content} for role, content in make_conversation(rng, turns)]
+        terminal = [{"output": line} for line in make_terminal(rng, commands)]
+        result.append((messages, terminal))
+    return result
+
+
+def build_compact(sessions, turns, commands, terminal_lines, session_budget, global_budget, offload_dir,
+                  persist=False):
+    rng = random.Random(0)
+    registry = MemoryRegistry(global_budget_bytes=global_budget)
+    conversation_store = ConversationStore(InProcessStore()) if persist else None
+    result = [conversation_store]
+    for session in range(sessions):
+        session_id = f"{session:032x}"
+        messages = MessageLog(session_budget_bytes=session_budget, offload_dir=offload_dir, registry=registry)
+        for role, content in make_conversation(rng, turns):
+            messages.append(role, content)
+            if persist:
+                conversation_store.append_messages(session_id, {"role": role, "content": content})
+        terminal = TerminalBuffer(max_lines=terminal_lines)
+        lines = make_terminal(rng, commands)
+        for command in lines:
+            output = next(lines)
+            terminal.append(command)
+            terminal.append(output)
+            if persist:
+                conversation_store.append_terminal(session_id, [command, output], terminal_lines)
+        result.append((messages, terminal))
+    return result
+
+
+def measure(build, *args):
+    tracemalloc.start()
+    sessions = build(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return sessions, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=20, help="user/assistant turns per session")
+    parser.add_argument("--commands", type=int, default=500, help="terminal commands per session")
+    parser.add_argument("--terminal-lines", type=int, default=500, help="terminal ring buffer size")
+    parser.add_argument("--session-budget", type=int, default=256 * 1024,
+                        help="per-session message budget in bytes")
+    parser.add_argument("--global-budget", type=int, default=8 * 1024 * 1024,
+                        help="process-wide message budget in bytes for the offload run")
+    args = parser.parse_args()
+
+    print(f"{args.sessions} sessions, {args.turns} turns and {args.commands} terminal commands each\n")
+    print(f"{'representation':<42}{'bytes/session':>15}{'peak MiB':>12}")
+
+    with tempfile.TemporaryDirectory() as offload_dir:
+        runs = [
+            ("legacy dicts", build_legacy, ()),
+            ("compact", build_compact, (args.terminal_lines, args.session_budget, 2 ** 62, None)),
+            ("compact + global budget offload", build_compact, (args.terminal_lines, args.session_budget, args.global_budget, offload_dir)),
+            ("compact + conversation store", build_compact, (args.terminal_lines, args.session_budget, 2 ** 62, None, True)),
+            ("compact + offload + conversation store", build_compact, (args.terminal_lines, args.session_budget, args.global_budget, offload_dir, True)),
+        ]
+        legacy = None
+        for name, build, extra in runs:
+            sessions, current, peak = measure(build, args.sessions, args.turns, args.commands, *extra)
+            per_session = current / args.sessions
+            legacy = legacy or per_session
+            print(f"{name:<42}{per_session:>15,.0f}{peak / 2 ** 20:>12.1f}   ({per_session / legacy:.0%} of legacy)")
+            del sessions
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from shared_state import RateLimiter
+from prompts import estimate_tokens
+
+
+def normalize_query(query):
+    """
+    Normalize a query so that trivially different phrasings share a cache entry.
+
+    Args:
+        query (str): The raw search query or question
+
+    Returns:
+        str: Lowercased query with punctuation and repeated whitespace removed
+    """
+    query = re.sub(r"[^\w\s]", " ", (query or "").lower())
+    return " ".join(query.split())
+
+
+class SearchCache:
+    """
+    Cache of web search results and precomputed draft answers, kept in the
+    shared state store so every replica sees the same entries.
+
+    Search results are shared by everyone. Draft answers are written with one
+    session's history and paid for with that session's API key, so they are
+    stored per owning session and only ever served back to it, and only while
+    that session's history is still the one the draft was written for
+    (identified by an opaque context string chosen by the caller).
+
+    Entries written by the prefetcher are flagged so that the first lookup
+    that uses them counts as a prefetch hit; expiry is left to the store.
+    """
+
+    PREFIX = "webmind:search:"
+    DRAFT_PREFIX = "webmind:draft:"
+
+    def __init__(self, store, ttl_seconds=900):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.metrics = PrefetchMetrics(store)
+
+    def _key(self, query):
+        return self.PREFIX + normalize_query(query)
+
+    def _draft_key(self, owner, query, context):
+        return f"{self.DRAFT_PREFIX}{owner}:{context}:{normalize_query(query)}"
+
+    def get(self, query):
+        """Return the cached entry for a query, or None if missing or expired."""
+        key = self._key(query)
+        value = self.store.get(key)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        # Only the first reader across all replicas claims the prefetch hit
+        if entry["prefetched"] and self.store.set(key + ":used", "1", ex=self.ttl_seconds, nx=True):
+            self.metrics.record_hit()
+        return entry
+
+    def peek(self, query):
+        """Return cached search results without counting a prefetch hit."""
+        value = self.store.get(self._key(query))
+        return json.loads(value)["results"] if value is not None else None
+
+    def put(self, query, results, prefetched=False):
+        """Store search results for a query."""
+        entry = {
+            "query": query,
+            "results": results,
+            "prefetched": prefetched,
+        }
+        key = self._key(query)
+        pipe = self.store.pipeline()
+        pipe.set(key, json.dumps(entry), ex=self.ttl_seconds)
+        pipe.delete(key + ":used")
+        pipe.execute()
+
+    def contains(self, query):
+        """Check for a live entry without counting it as a prefetch hit."""
+        return self.store.get(self._key(query)) is not None
+
+    def put_draft(self, owner, query, draft, tokens, context=""):
+        """Store a draft answer that only the owning session, with the same context, may use."""
+        value = json.dumps({"draft": draft, "tokens": tokens})
+        self.store.set(self._draft_key(owner, query, context), value, ex=self.ttl_seconds)
+
+    def has_draft(self, owner, query, context=""):
+        return self.store.get(self._draft_key(owner, query, context)) is not None
+
+    def take_draft(self, owner, query, context=""):
+        """
+        Return and remove the owning session's draft answer for a query.
+
+        Returns:
+            str: The draft, or None if this session has no draft for the query
+            written for the given context
+        """
+        key = self._draft_key(owner, query, context)
+        pipe = self.store.pipeline()
+        pipe.get(key)
+        pipe.delete(key)
+        value = pipe.execute()[0]
+        if value is None:
+            return None
+        entry = json.loads(value)
+        self.metrics.record_draft_hit(entry["tokens"])
+        return entry["draft"]
+
+
+class PrefetchMetrics:
+    """
+    Counters used to tune how many follow-up questions are prefetched.
+
+    Counters live in the shared store, so the numbers cover all replicas.
+    """
+
+    PREFIX = "webmind:prefetch:metrics:"
+    COUNTERS = (
+        "prefetched_searches",
+        "prefetched_drafts",
+        "draft_tokens_spent",
+        "hits",
+        "draft_hits",
+        "draft_tokens_hit",
+        "skipped_over_budget",
+    )
+
+    def __init__(self, store):
+        self.store = store
+
+    def _incr(self, **amounts):
+        pipe = self.store.pipeline()
+        for name, amount in amounts.items():
+            pipe.incrby(self.PREFIX + name, amount)
+        pipe.execute()
+
+    def record_prefetch(self):
+        self._incr(prefetched_searches=1)
+
+    def record_draft(self, tokens):
+        self._incr(prefetched_drafts=1, draft_tokens_spent=tokens)
+
+    def record_hit(self):
+        self._incr(hits=1)
+
+    def record_draft_hit(self, tokens):
+        self._incr(draft_hits=1, draft_tokens_hit=tokens)
+
+    def record_skip(self):
+        self._incr(skipped_over_budget=1)
+
+    def snapshot(self):
+        """
+        Return the current counters together with derived ratios.
+
+        Prefetches that have not been used yet count as wasted, including
+        entries that are still live in the cache. Draft tokens are the billed
+        total (prompt plus completion) reported by the API.
+
+        Returns:
+            dict: Raw counters plus wasted_searches, wasted_draft_tokens,
+            hit_rate and wasted_spend_ratio (0.0 when nothing has been
+            prefetched yet)
+        """
+        values = self.store.mget([self.PREFIX + name for name in self.COUNTERS])
+        stats = {name: int(value or 0) for name, value in zip(self.COUNTERS, values)}
+        searches = stats["prefetched_searches"]
+        stats["wasted_searches"] = max(searches - stats["hits"], 0)
+        stats["wasted_draft_tokens"] = max(stats["draft_tokens_spent"] - stats["draft_tokens_hit"], 0)
+        stats["hit_rate"] = stats["hits"] / searches if searches else 0.0
+        stats["wasted_spend_ratio"] = stats["wasted_searches"] / searches if searches else 0.0
+        return stats
+
+
+class PrefetchBudget:
+    """
+    Hourly caps on prefetch searches and draft-answer tokens, shared by all
+    replicas through the state store.
+
+    Spend is reserved before work starts so concurrent prefetches can never
+    overshoot the caps. A draft reserves an estimate of its prompt plus the
+    completion cap and is settled against the billed usage afterwards.
+    """
+
+    def __init__(self, store, max_searches_per_hour=60, max_draft_tokens_per_hour=20000, window_seconds=3600):
+        self.searches = RateLimiter(store, "prefetch_searches", max_searches_per_hour, window_seconds)
+        self.draft_tokens = RateLimiter(store, "prefetch_draft_tokens", max_draft_tokens_per_hour, window_seconds)
+
+    def reserve_search(self):
+        """Reserve one search; returns False if the hourly cap is reached."""
+        return self.searches.try_acquire(1)
+
+    def reserve_tokens(self, tokens):
+        """Reserve draft tokens; returns False if the hourly cap would be exceeded."""
+        return self.draft_tokens.try_acquire(tokens)
+
+    def settle_tokens(self, reserved, used):
+        """Charge the difference between the tokens a draft reserved and actually used."""
+        self.draft_tokens.charge(used - reserved)
+
+
+class Prefetcher:
+    """
+    Speculatively searches (and optionally answers) "People also ask" questions
+    in background threads so that a matching follow-up is served from cache.
+    """
+
+    PENDING_PREFIX = "webmind:prefetch:pending:"
+
+    def __init__(self, cache, search_fn, budget, top_k=2, max_workers=2, pending_ttl=120):
+        self.cache = cache
+        self.search_fn = search_fn
+        self.budget = budget
+        self.top_k = top_k
+        self.pending_ttl = pending_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+
+    def schedule(self, search_results, owner=None, build_draft=None, complete_draft=None, draft_max_tokens=400,
+                 context=""):
+        """
+        Queue background prefetches for the top-k related questions.
+
+        Args:
+            search_results (dict): Results from perform_web_search for the answered query
+            owner (str): Session the drafts are written for; drafts are only served back to it
+            build_draft (callable): Optional function (question, results) -> chat messages
+                for a draft answer
+            complete_draft (callable): Function (messages, max_tokens) -> (text, tokens_used)
+                that runs the draft completion; required with build_draft. Text is None
+                for an unusable (e.g. truncated) completion, which is not stored
+            draft_max_tokens (int): Completion cap for a single draft
+            context (str): Identifies the owner's history the drafts are built from;
+                drafts are only served back with the same context
+
+        Returns:
+            list: The questions that were queued
+        """
+        store = self.cache.store
+        drafting = build_draft is not None and owner is not None
+        queued = []
+        for question in (search_results or {}).get("related_questions", [])[:self.top_k]:
+            text = question.get("question", "")
+            key = normalize_query(text)
+            if not key:
+                continue
+            needs_search = not self.cache.contains(text)
+            needs_draft = drafting and not self.cache.has_draft(owner, text, context)
+            if not needs_search and not needs_draft:
+                continue
+            # Claim the question so other sessions and replicas don't prefetch it twice
+            claim = self.PENDING_PREFIX + (f"{owner}:{context}:{key}" if needs_draft else key)
+            if not store.set(claim, "1", ex=self.pending_ttl, nx=True):
+                continue
+            if needs_search and not self.budget.reserve_search():
+                self.cache.metrics.record_skip()
+                store.delete(claim)
+                break
+            self._executor.submit(self._run, text, claim, needs_search, owner if needs_draft else None,
+                                  build_draft, complete_draft, draft_max_tokens, context)
+            queued.append(text)
+        return queued
+
+    def _run(self, question, claim, needs_search, owner, build_draft, complete_draft, draft_max_tokens, context):
+        try:
+            if needs_search:
+                results = self.search_fn(question)
+                if "error" in results and not results.get("organic_results"):
+                    return
+                self.cache.put(question, results, prefetched=True)
+                self.cache.metrics.record_prefetch()
+            else:
+                results = self.cache.peek(question)
+                if results is None:
+                    return
+
+            if owner is not None:
+                self._draft(question, results, owner, build_draft, complete_draft, draft_max_tokens, context)
+        except Exception as e:
+            print(f"Error prefetching related question: {str(e)}")
+        finally:
+            self.cache.store.delete(claim)
+
+    def _draft(self, question, results, owner, build_draft, complete_draft, draft_max_tokens, context):
+        # Reserve the whole prompt plus the completion cap, then settle on the billed usage
+        messages = build_draft(question, results)
+        reserved = estimate_tokens(messages) + draft_max_tokens
+        if not self.budget.reserve_tokens(reserved):
+            self.cache.metrics.record_skip()
+            return
+        used = reserved
+        try:
+            draft, used = complete_draft(messages, draft_max_tokens)
+        except Exception as e:
+            print(f"Error drafting prefetched answer: {str(e)}")
+            return
+        finally:
+            self.budget.settle_tokens(reserved, used)
+        self.cache.metrics.record_draft(used)
+        # Truncated drafts are paid for but never served as a final answer
+        if draft is not None:
+            self.cache.put_draft(owner, question, draft, used, context)
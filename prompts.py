@@ -0,0 +1,139 @@
+# Prompt assembly for the chat model.
+#
+# Providers cache the longest prompt prefix they have seen before, so the
+# layout is: static instructions, then the conversation history (which only
+# ever grows at the end), then the per-turn volatile context (user, date and
+# search results). Nothing that changes per user, per day or per query may
+# appear before the history.
+
+STATIC_INSTRUCTIONS = """You are WebMind, an advanced AI assistant with real web search capabilities.
+
+When answering questions:
+1. Use the provided search results (if available) to give accurate, up-to-date information.
+2. Include relevant facts, statistics, and citations when appropriate using [Source: Website] format.
+3. For coding questions, provide modern, best-practice code examples.
+4. Structure complex responses with clear headings and organized information.
+5. If you're unsure about some information, acknowledge this rather than making up facts.
+
+The final system message of each request holds the current context: who you are talking to, today's date and any web search results for the latest question.
+
+Your goal is to provide the most helpful, accurate, and comprehensive response possible."""
+
+
+def format_search_context(search_results):
+    """
+    Format search results as text for the model.
+
+    Args:
+        search_results (dict): Results from perform_web_search
+
+    Returns:
+        str: Answer box, knowledge panel, organic results and related questions as text
+    """
+    search_content = "Here are the web search results for your query:\n\n"
+
+    # Add answer box/featured snippet if available
+    if search_results.get("answer_box"):
+        ab = search_results["answer_box"]
+        search_content += f"FEATURED ANSWER: {ab.get('title', '')}\n{ab.get('answer', '')}\n"
+        if ab.get('source'):
+            search_content += f"[Source: {ab.get('source')}]\n\n"
+
+    # Add knowledge graph if available
+    if search_results.get("knowledge_graph"):
+        kg = search_results["knowledge_graph"]
+        search_content += f"KNOWLEDGE PANEL: {kg.get('title', '')} - {kg.get('type', '')}\n"
+        search_content += f"{kg.get('description', '')}\n\n"
+
+    # Add organic search results
+    if search_results.get("organic_results"):
+        search_content += "SEARCH RESULTS:\n"
+        for i, result in enumerate(search_results["organic_results"], 1):
+            search_content += f"{i}. {result['title']}\n"
+            search_content += f"   {result['snippet']}\n"
+            search_content += f"   [Source: {result['source']}]\n\n"
+
+    # Add related questions if available
+    if search_results.get("related_questions"):
+        search_content += "PEOPLE ALSO ASK:\n"
+        for i, question in enumerate(search_results["related_questions"], 1):
+            search_content += f"{i}. {question['question']}\n"
+            search_content += f"   {question['answer']}\n"
+            if question.get('source'):
+                search_content += f"   [Source: {question['source']}]\n"
+
+    return search_content
+
+
+def build_volatile_context(username, current_date, search_results=None):
+    """
+    Build the per-turn context message that follows the conversation history.
+
+    Args:
+        username (str): The user WebMind is talking to
+        current_date (str): Today's date as YYYY-MM-DD
+        search_results (dict): Optional web search results for the latest question
+
+    Returns:
+        str: The context message body
+    """
+    context = f"Current context: you are talking to {username}. Today's date is {current_date}."
+    if search_results:
+        context += "\n\n" + format_search_context(search_results)
+    return context
+
+
+def build_messages(history, username, current_date, search_results=None):
+    """
+    Assemble chat messages with the stable prefix first and volatile fields last.
+
+    Args:
+        history (list): Conversation so far as dicts with role and content,
+            ending with the latest user message
+        username (str): The user WebMind is talking to
+        current_date (str): Today's date as YYYY-MM-DD
+        search_results (dict): Optional web search results for the latest question
+
+    Returns:
+        list: Messages ready for the chat completions API
+    """
+    messages = [{"role": "system", "content": STATIC_INSTRUCTIONS}]
+    messages.extend({"role": m["role"], "content": m["content"]} for m in history)
+    messages.append({"role": "system", "content": build_volatile_context(username, current_date, search_results)})
+    return messages
+
+
+def estimate_tokens(messages):
+    """
+    Roughly estimate the prompt tokens of chat messages before sending them.
+
+    Uses about four characters per token plus a small per-message overhead,
+    which errs on the high side for English text.
+
+    Args:
+        messages (list): Chat messages as dicts with role and content
+
+    Returns:
+        int: Estimated prompt tokens
+    """
+    return sum(len(m["content"]) // 4 + 4 for m in messages)
+
+
+def prompt_cache_usage(usage):
+    """
+    Extract provider-side prompt cache statistics from a usage response.
+
+    Args:
+        usage: The usage object of a chat completion response (may be None)
+
+    Returns:
+        dict: prompt_tokens, cached_tokens and cache_hit_ratio (0.0 when unknown)
+    """
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "cache_hit_ratio": cached_tokens / prompt_tokens if prompt_tokens else 0.0,
+    }
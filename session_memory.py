@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import zlib
+import itertools
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import deque
+
+
+class Message:
+    """
+    A single chat message.
+
+    Uses __slots__ and interned role strings to keep the per-message overhead
+    small, and stores cold content zlib-compressed. Supports message["role"]
+    and message["content"] so it can be used wherever a message dict was.
+    """
+
+    __slots__ = ("role", "_text", "_packed")
+
+    def __init__(self, role, content):
+        self.role = sys.intern(role)
+        self._text = content
+        self._packed = None
+
+    @property
+    def content(self):
+        if self._text is not None:
+            return self._text
+        return zlib.decompress(self._packed).decode("utf-8")
+
+    def __getitem__(self, key):
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def compress(self, min_size=128):
+        """Compress the content in place; returns the change in footprint in bytes."""
+        if self._text is None or len(self._text) < min_size:
+            return 0
+        before = self.nbytes()
+        packed = zlib.compress(self._text.encode("utf-8"))
+        if len(packed) >= len(self._text):
+            return 0
+        self._packed, self._text = packed, None
+        return self.nbytes() - before
+
+    def nbytes(self):
+        """Approximate memory footprint of the message and its payload."""
+        payload = self._text if self._text is not None else self._packed
+        return sys.getsizeof(self) + sys.getsizeof(payload)
+
+    def to_dict(self):
+        return {"role": self.role, "content": self.content}
+
+
+class MemoryRegistry:
+    """
+    Tracks memory used by every session's message log in the process and
+    enforces a global budget by offloading old messages.
+
+    The session that is growing is offloaded first so that the common case
+    stays O(1); when it has nothing cold left, sessions with cold messages
+    are tried from the largest down.
+
+    The budget is soft: hot messages are never offloaded, so when every
+    session holds only hot messages the process stays over budget, and
+    enforce() returns immediately until some message turns cold again.
+    """
+
+    def __init__(self, global_budget_bytes=256 * 1024 * 1024):
+        self.global_budget_bytes = global_budget_bytes
+        self.total_bytes = 0
+        self.cold_messages = 0
+        self._sizes = {}
+        self._cold = {}
+        self._logs = {}
+        self._lock = threading.Lock()
+
+    def register(self, log):
+        key = id(log)
+        with self._lock:
+            self._sizes[key] = 0
+            self._cold[key] = 0
+            self._logs[key] = weakref.ref(log)
+        # Sessions that are garbage collected stop counting against the budget
+        weakref.finalize(log, self._forget, key)
+
+    def _forget(self, key):
+        with self._lock:
+            self.total_bytes -= self._sizes.pop(key, 0)
+            self.cold_messages -= self._cold.pop(key, 0)
+            self._logs.pop(key, None)
+
+    def account(self, log, delta, cold_delta=0):
+        with self._lock:
+            self._sizes[id(log)] += delta
+            self._cold[id(log)] += cold_delta
+            self.total_bytes += delta
+            self.cold_messages += cold_delta
+
+    def enforce(self, growing=None):
+        """Offload old messages until the process is back under its global budget."""
+        if growing is not None:
+            while self.total_bytes > self.global_budget_bytes and growing.offload_oldest():
+                pass
+        if self.total_bytes <= self.global_budget_bytes or not self.cold_messages:
+            return
+        with self._lock:
+            candidates = [key for key, cold in self._cold.items() if cold]
+            logs = [self._logs[key] for key in sorted(candidates, key=self._sizes.get, reverse=True)]
+        for ref in logs:
+            log = ref()
+            while log is not None and self.total_bytes > self.global_budget_bytes and log.offload_oldest():
+                pass
+            if self.total_bytes <= self.global_budget_bytes:
+                return
+
+
+class MessageLog:
+    """
+    Compact chat history for one session.
+
+    The newest hot_messages messages are kept as plain text, older ones are
+    compressed, and when the session exceeds its budget the oldest messages
+    are offloaded to a per-session file on disk (or dropped if offload_dir is
+    None). Iteration always yields the full history in order.
+
+    Offloaded history is plaintext, so each session spills into its own
+    private (0o700) subdirectory of offload_dir and the configured directory
+    itself is left untouched. If the spill can't be written the message is
+    dropped instead.
+    """
+
+    __slots__ = ("_messages", "_lock", "_spill_path", "_spilled", "nbytes",
+                 "hot_messages", "session_budget_bytes", "offload_dir", "registry", "__weakref__")
+
+    def __init__(self, messages=None, hot_messages=8, session_budget_bytes=256 * 1024,
+                 offload_dir=None, registry=None):
+        self._messages = deque()
+        self._lock = threading.RLock()
+        self._spill_path = None
+        self._spilled = 0
+        self.nbytes = 0
+        self.hot_messages = hot_messages
+        self.session_budget_bytes = session_budget_bytes
+        self.offload_dir = offload_dir
+        self.registry = registry
+        if registry is not None:
+            registry.register(self)
+        for message in messages or []:
+            self.append(message["role"], message["content"])
+
+    def __len__(self):
+        return self._spilled + len(self._messages)
+
+    def __iter__(self):
+        with self._lock:
+            in_memory = list(self._messages)
+            spill_path, spilled = self._spill_path, self._spilled
+        if spilled:
+            with open(spill_path, encoding="utf-8") as spill_file:
+                # Lines appended after the snapshot are already in in_memory
+                for line in itertools.islice(spill_file, spilled):
+                    data = json.loads(line)
+                    yield Message(data["role"], data["content"])
+        yield from in_memory
+
+    def last(self):
+        """Return the newest message, or None if the history is empty or fully offloaded."""
+        with self._lock:
+            return self._messages[-1] if self._messages else None
+
+    def _account(self, delta, cold_delta=0):
+        # Caller must hold the lock
+        self.nbytes += delta
+        if self.registry is not None:
+            self.registry.account(self, delta, cold_delta)
+
+    def append(self, role, content):
+        """Add a message, compressing cold turns and enforcing memory budgets."""
+        message = Message(role, content)
+        with self._lock:
+            self._messages.append(message)
+            self._account(message.nbytes())
+
+            # The message that just left the hot window becomes cold
+            if len(self._messages) > self.hot_messages:
+                cold = self._messages[-self.hot_messages - 1]
+                self._account(cold.compress(), 1)
+
+            while self.nbytes > self.session_budget_bytes and self.offload_oldest():
+                pass
+
+        if self.registry is not None:
+            self.registry.enforce(growing=self)
+
+    def offload_oldest(self):
+        """
+        Move the oldest in-memory message to disk, or drop it without an offload dir.
+
+        Returns:
+            bool: False if only hot messages are left in memory
+        """
+        with self._lock:
+            if len(self._messages) <= self.hot_messages:
+                return False
+            message = self._messages.popleft()
+            self._account(-message.nbytes(), -1)
+            if self.offload_dir is None:
+                return True
+            try:
+                if self._spill_path is None:
+                    # mkdtemp creates a fresh directory only this user can enter
+                    spill_dir = tempfile.mkdtemp(prefix="webmind-session-", dir=self.offload_dir)
+                    self._spill_path = os.path.join(spill_dir, "history.jsonl")
+                    weakref.finalize(self, _remove_spill, self._spill_path)
+                fd = os.open(self._spill_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+                with open(fd, "a", encoding="utf-8") as spill_file:
+                    spill_file.write(json.dumps(message.to_dict()) + "\n")
+            except OSError as e:
+                # Keep serving the session; drop this and later cold messages instead
+                print(f"Error offloading session history: {str(e)}")
+                self.offload_dir = None
+                return True
+            self._spilled += 1
+            return True
+
+    def close(self):
+        """Drop the in-memory history and delete any offloaded history."""
+        with self._lock:
+            self._account(-self.nbytes, -max(len(self._messages) - self.hot_messages, 0))
+            self._messages.clear()
+            if self._spill_path is not None:
+                _remove_spill(self._spill_path)
+            self._spill_path, self._spilled = None, 0
+
+
+class TerminalBuffer:
+    """Ring buffer of terminal output lines that keeps only the newest max_lines."""
+
+    __slots__ = ("_lines",)
+
+    def __init__(self, lines=None, max_lines=500):
+        self._lines = deque(lines or [], maxlen=max_lines)
+
+    def __iter__(self):
+        return iter(self._lines)
+
+    def __len__(self):
+        return len(self._lines)
+
+    def append(self, output):
+        self._lines.append(output)
+
+    def clear(self):
+        self._lines.clear()
+
+
+def _remove_spill(path):
+    shutil.rmtree(os.path.dirname(path), ignore_errors=True)
@@ -0,0 +1,334 @@
+import hmac
+import json
+import time
+import heapq
+import hashlib
+import secrets
+import threading
+
+
+class InProcessStore:
+    """
+    In-process stand-in for a Redis server.
+
+    Implements the subset of the redis-py client API used by WebMind (strings
+    and lists with expiry, counters and pipelines) so that the app and tests
+    behave the same with or without a shared Redis instance. Values are stored
+    as strings exactly like a Redis client with decode_responses=True would
+    return them.
+
+    Like Redis, expired keys are removed both when they are accessed and by an
+    active sweep: every command frees a bounded number of expired keys in
+    deadline order, so keys that are never read again don't stay resident.
+    """
+
+    SWEEP_LIMIT = 64
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._deadlines = []
+        self._lock = threading.RLock()
+
+    def _tick(self):
+        # Caller must hold the lock
+        now = time.time()
+        swept = 0
+        while self._deadlines and self._deadlines[0][0] <= now and swept < self.SWEEP_LIMIT:
+            deadline, key = heapq.heappop(self._deadlines)
+            # Entries left behind by a later expire/set of the same key are stale
+            if self._expires.get(key) == deadline:
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            swept += 1
+        # Keys whose expiry is refreshed often leave stale entries; rebuild when they dominate
+        if len(self._deadlines) > 2 * len(self._expires) + self.SWEEP_LIMIT:
+            self._deadlines = [(deadline, key) for key, deadline in self._expires.items()]
+            heapq.heapify(self._deadlines)
+        return now
+
+    def _set_expiry(self, key, deadline):
+        # Caller must hold the lock
+        self._expires[key] = deadline
+        heapq.heappush(self._deadlines, (deadline, key))
+
+    def _alive(self, key, now):
+        # Caller must hold the lock
+        deadline = self._expires.get(key)
+        if deadline is not None and deadline <= now:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def get(self, name):
+        with self._lock:
+            return self._data[name] if self._alive(name, self._tick()) else None
+
+    def mget(self, keys, *args):
+        keys = list(keys) if isinstance(keys, (list, tuple)) else [keys]
+        keys.extend(args)
+        with self._lock:
+            return [self.get(key) for key in keys]
+
+    def set(self, name, value, ex=None, nx=False):
+        with self._lock:
+            now = self._tick()
+            if nx and self._alive(name, now):
+                return None
+            self._data[name] = str(value)
+            if ex is not None:
+                self._set_expiry(name, now + ex)
+            else:
+                self._expires.pop(name, None)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            now = self._tick()
+            removed = 0
+            for name in names:
+                if self._alive(name, now):
+                    removed += 1
+                self._data.pop(name, None)
+                self._expires.pop(name, None)
+            return removed
+
+    def incrby(self, name, amount=1):
+        with self._lock:
+            value = int(self.get(name) or 0) + amount
+            self._data[name] = str(value)
+            return value
+
+    def rpush(self, name, *values):
+        with self._lock:
+            if not self._alive(name, self._tick()):
+                self._data[name] = []
+            self._data[name].extend(str(value) for value in values)
+            return len(self._data[name])
+
+    def lrange(self, name, start, end):
+        with self._lock:
+            if not self._alive(name, self._tick()):
+                return []
+            return list(self._data[name][_list_slice(start, end)])
+
+    def ltrim(self, name, start, end):
+        with self._lock:
+            if self._alive(name, self._tick()):
+                self._data[name] = self._data[name][_list_slice(start, end)]
+            return True
+
+    def expire(self, name, time_seconds):
+        with self._lock:
+            now = self._tick()
+            if not self._alive(name, now):
+                return False
+            self._set_expiry(name, now + time_seconds)
+            return True
+
+    def pipeline(self, transaction=True):
+        return InProcessPipeline(self)
+
+
+def _list_slice(start, end):
+    # Redis list ranges include the end index; -1 means the last element
+    return slice(start, None if end == -1 else end + 1)
+
+
+class InProcessPipeline:
+    """Buffers commands and runs them under one lock, like a MULTI/EXEC block."""
+
+    def __init__(self, store):
+        self._store = store
+        self._commands = []
+
+    def __getattr__(self, name):
+        command = getattr(self._store, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((command, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._store._lock:
+            results = [command(*args, **kwargs) for command, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._commands = []
+
+
+def connect(url=None):
+    """
+    Connect to the shared state store.
+
+    Args:
+        url (str): A redis:// or rediss:// URL, or None / "memory://" for the
+            in-process store
+
+    Returns:
+        object: A redis-py client or an InProcessStore with the same interface
+    """
+    if not url or url.startswith("memory://"):
+        return InProcessStore()
+
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError("The redis package is required for WEBMIND_STATE_URL=" + url.split("://")[0] + "://... "
+                           "Install it with: pip install redis")
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+class RateLimiter:
+    """
+    Fixed-window quota shared by every replica connected to the same store.
+
+    Each window is a single counter key, so acquiring capacity costs one
+    pipelined round trip regardless of how many replicas are running.
+    """
+
+    def __init__(self, store, name, limit, window_seconds=3600):
+        self.store = store
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+    def _key(self):
+        window = int(time.time() // self.window_seconds)
+        return f"webmind:ratelimit:{self.name}:{window}"
+
+    def try_acquire(self, amount=1):
+        """Reserve capacity; returns False (and reserves nothing) if it would exceed the limit."""
+        key = self._key()
+        pipe = self.store.pipeline()
+        pipe.incrby(key, amount)
+        pipe.expire(key, self.window_seconds)
+        used = pipe.execute()[0]
+        if used > self.limit:
+            self.store.incrby(key, -amount)
+            return False
+        return True
+
+    def charge(self, amount):
+        """Add (or refund, if negative) capacity without checking the limit."""
+        if amount:
+            key = self._key()
+            pipe = self.store.pipeline()
+            pipe.incrby(key, amount)
+            pipe.expire(key, self.window_seconds)
+            pipe.execute()
+
+    def used(self):
+        """Return the capacity consumed in the current window."""
+        return int(self.store.get(self._key()) or 0)
+
+
+class SessionTokens:
+    """
+    Signed session tokens for resuming a session on any replica.
+
+    A token is "<session id>.<HMAC of the id>", so clients cannot pick or
+    guess a session id. The token is still a bearer credential: anyone who
+    has the URL containing it can resume that session, so it must be treated
+    like a password. All replicas need the same secret.
+    """
+
+    def __init__(self, secret):
+        self._secret = secret.encode("utf-8")
+
+    def _sign(self, session_id):
+        return hmac.new(self._secret, session_id.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def issue(self):
+        """
+        Create a new session.
+
+        Returns:
+            tuple: (session id, token to hand to the client)
+        """
+        session_id = secrets.token_hex(16)
+        return session_id, f"{session_id}.{self._sign(session_id)}"
+
+    def verify(self, token):
+        """Return the session id for a well-formed, correctly signed token, else None."""
+        session_id, _, signature = (token or "").partition(".")
+        if len(session_id) != 32 or len(signature) != 32:
+            return None
+        if any(c not in "0123456789abcdef" for c in session_id + signature):
+            return None
+        if not hmac.compare_digest(signature, self._sign(session_id)):
+            return None
+        return session_id
+
+
+class ConversationStore:
+    """
+    Per-session conversation state (username, chat and terminal history) kept
+    in the shared store so any replica can serve any session.
+
+    Histories are Redis lists that only ever grow at the end, so each turn
+    writes just its new messages instead of the whole conversation, and two
+    tabs of the same session append to rather than overwrite each other.
+
+    API credentials are deliberately never written here; they stay in the
+    session that entered them.
+    """
+
+    def __init__(self, store, ttl_seconds=7 * 24 * 3600):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+
+    def _key(self, session_id, field):
+        return f"webmind:session:{session_id}:{field}"
+
+    def load(self, session_id):
+        """
+        Load every stored field for a session in one batched round trip.
+
+        Returns:
+            dict: username, messages and terminal_history for the fields that exist
+        """
+        pipe = self.store.pipeline()
+        pipe.get(self._key(session_id, "username"))
+        pipe.lrange(self._key(session_id, "messages"), 0, -1)
+        pipe.lrange(self._key(session_id, "terminal_history"), 0, -1)
+        username, messages, terminal_history = pipe.execute()
+
+        stored = {}
+        if username is not None:
+            stored["username"] = json.loads(username)
+        if messages:
+            stored["messages"] = [json.loads(message) for message in messages]
+        if terminal_history:
+            stored["terminal_history"] = [json.loads(line) for line in terminal_history]
+        return stored
+
+    def set_username(self, session_id, username):
+        self.store.set(self._key(session_id, "username"), json.dumps(username), ex=self.ttl_seconds)
+
+    def append_messages(self, session_id, *messages):
+        """Append chat messages (dicts with role and content) in one pipelined round trip."""
+        key = self._key(session_id, "messages")
+        pipe = self.store.pipeline()
+        pipe.rpush(key, *[json.dumps(message) for message in messages])
+        pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+
+    def append_terminal(self, session_id, lines, max_lines):
+        """Append terminal output, keeping only the newest max_lines lines."""
+        key = self._key(session_id, "terminal_history")
+        pipe = self.store.pipeline()
+        pipe.rpush(key, *[json.dumps(line) for line in lines])
+        pipe.ltrim(key, -max_lines, -1)
+        pipe.expire(key, self.ttl_seconds)
+        pipe.execute()
+
+    def reset(self, session_id, *fields):
+        """Remove the given fields (username, messages, terminal_history) for a session."""
+        self.store.delete(*[self._key(session_id, field) for field in fields])
@@ -0,0 +1,16 @@
+import pytest
+
+from shared_state import InProcessStore
+
+
+def _fakeredis():
+    fakeredis = pytest.importorskip("fakeredis")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+@pytest.fixture(params=["memory", "fakeredis"])
+def store(request):
+    """A fresh state store; every test runs against both implementations."""
+    if request.param == "memory":
+        return InProcessStore()
+    return _fakeredis()
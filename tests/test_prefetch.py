@@ -0,0 +1,179 @@
+from prefetch import normalize_query, SearchCache, PrefetchMetrics, PrefetchBudget, Prefetcher
+from prompts import estimate_tokens
+
+RESULTS = {
+    "organic_results": [{"title": "t", "snippet": "s", "source": "x"}],
+    "related_questions": [{"question": "Why is the sky blue?", "answer": "a"},
+                          {"question": "What is Rayleigh scattering?", "answer": "a"},
+                          {"question": "A third question?", "answer": "a"}],
+}
+
+
+class InlineExecutor:
+    """Runs submitted work immediately so prefetches finish before asserting."""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+def make_prefetcher(store, **budget):
+    searches = []
+
+    def search(query):
+        searches.append(query)
+        return {"organic_results": [{"title": query, "snippet": "s", "source": "x"}]}
+
+    prefetcher = Prefetcher(SearchCache(store), search, PrefetchBudget(store, **budget), top_k=2)
+    prefetcher._executor = InlineExecutor()
+    return prefetcher, searches
+
+
+def test_normalize_query():
+    assert normalize_query("  What's   the NEWS?? ") == "what s the news"
+    assert normalize_query(None) == ""
+
+
+def test_metrics_snapshot_derives_ratios(store):
+    metrics = PrefetchMetrics(store)
+    assert metrics.snapshot()["hit_rate"] == 0.0
+    for _ in range(4):
+        metrics.record_prefetch()
+    metrics.record_hit()
+    metrics.record_draft(100)
+    metrics.record_draft_hit(60)
+    metrics.record_skip()
+    stats = metrics.snapshot()
+    assert stats["prefetched_searches"] == 4
+    assert stats["hits"] == 1
+    assert stats["wasted_searches"] == 3
+    assert stats["hit_rate"] == 0.25
+    assert stats["wasted_spend_ratio"] == 0.75
+    assert stats["wasted_draft_tokens"] == 40
+    assert stats["skipped_over_budget"] == 1
+
+
+def test_only_first_lookup_claims_a_prefetch_hit(store):
+    cache = SearchCache(store)
+    cache.put("Why is the sky blue?", RESULTS, prefetched=True)
+    # Another replica sharing the store sees the same entry
+    other_replica = SearchCache(store)
+    assert cache.get("why is the sky blue") is not None
+    assert other_replica.get("Why is the sky blue?") is not None
+    assert cache.metrics.snapshot()["hits"] == 1
+
+
+def test_lookups_of_live_searches_are_not_prefetch_hits(store):
+    cache = SearchCache(store)
+    cache.put("query", RESULTS)
+    assert cache.get("query")["results"] == RESULTS
+    assert cache.peek("query") == RESULTS
+    assert cache.metrics.snapshot()["hits"] == 0
+
+
+def test_refreshing_an_entry_resets_its_hit_claim(store):
+    cache = SearchCache(store)
+    cache.put("query", RESULTS, prefetched=True)
+    cache.get("query")
+    cache.put("query", RESULTS, prefetched=True)
+    cache.get("query")
+    assert cache.metrics.snapshot()["hits"] == 2
+
+
+def test_drafts_are_only_served_to_their_session(store):
+    cache = SearchCache(store)
+    cache.put_draft("alice", "Why is the sky blue?", "Because...", tokens=50)
+    assert cache.take_draft("bob", "Why is the sky blue?") is None
+    assert cache.take_draft("alice", "why is the sky blue") == "Because..."
+    # A draft is served once
+    assert cache.take_draft("alice", "Why is the sky blue?") is None
+    assert cache.metrics.snapshot()["draft_tokens_hit"] == 50
+
+
+def test_prefetcher_searches_top_k_once(store):
+    prefetcher, searches = make_prefetcher(store)
+    assert prefetcher.schedule(RESULTS) == ["Why is the sky blue?", "What is Rayleigh scattering?"]
+    assert prefetcher.schedule(RESULTS) == []
+    assert searches == ["Why is the sky blue?", "What is Rayleigh scattering?"]
+    assert prefetcher.cache.metrics.snapshot()["prefetched_searches"] == 2
+
+
+def test_prefetcher_stops_at_search_budget(store):
+    prefetcher, searches = make_prefetcher(store, max_searches_per_hour=1)
+    assert prefetcher.schedule(RESULTS) == ["Why is the sky blue?"]
+    assert prefetcher.cache.metrics.snapshot()["skipped_over_budget"] == 1
+
+
+def test_prefetcher_drafts_per_session_and_settles_tokens(store):
+    prefetcher, searches = make_prefetcher(store)
+
+    def build_draft(question, results):
+        return [{"role": "user", "content": question}]
+
+    def complete_draft(messages, max_tokens):
+        return f"Draft for {messages[0]['content']}", 30
+
+    for owner in ("alice", "bob"):
+        prefetcher.schedule(RESULTS, owner=owner, build_draft=build_draft,
+                            complete_draft=complete_draft, draft_max_tokens=400)
+    # Searches are shared, drafts are written for each session
+    assert len(searches) == 2
+    assert prefetcher.cache.take_draft("bob", "Why is the sky blue?") == "Draft for Why is the sky blue?"
+    # Reservations of prompt estimate + 400 are settled down to the 30 tokens billed
+    assert prefetcher.budget.draft_tokens.used() == 4 * 30
+
+
+def test_prefetcher_skips_drafts_over_token_budget(store):
+    prefetcher, _ = make_prefetcher(store, max_draft_tokens_per_hour=100)
+    calls = []
+    prefetcher.schedule(RESULTS, owner="alice",
+                        build_draft=lambda question, results: [{"role": "user", "content": question}],
+                        complete_draft=lambda messages, max_tokens: calls.append(messages) or ("d", 10),
+                        draft_max_tokens=400)
+    assert calls == []
+    assert prefetcher.budget.draft_tokens.used() == 0
+    assert prefetcher.cache.metrics.snapshot()["skipped_over_budget"] == 2
+
+
+def test_failed_draft_keeps_its_reservation(store):
+    # What a failed call was billed is unknown, so the full reservation stays charged
+    prefetcher, _ = make_prefetcher(store)
+
+    def build_draft(question, results):
+        return [{"role": "user", "content": question}]
+
+    def complete_draft(messages, max_tokens):
+        raise RuntimeError("API down")
+
+    prefetcher.schedule(RESULTS, owner="alice", build_draft=build_draft,
+                        complete_draft=complete_draft, draft_max_tokens=400)
+    expected = sum(estimate_tokens(build_draft(q["question"], None)) + 400 for q in RESULTS["related_questions"][:2])
+    assert prefetcher.budget.draft_tokens.used() == expected
+    assert not prefetcher.cache.has_draft("alice", "Why is the sky blue?")
+
+
+def test_drafts_are_only_served_for_the_history_they_were_built_from(store):
+    cache = SearchCache(store)
+    cache.put_draft("alice", "Why is the sky blue?", "Because...", tokens=50, context="2-abc")
+    # Another turn happened since the draft was scheduled
+    assert cache.take_draft("alice", "Why is the sky blue?", context="4-def") is None
+    assert cache.take_draft("alice", "Why is the sky blue?", context="2-abc") == "Because..."
+
+
+def test_prefetcher_keys_drafts_by_context(store):
+    prefetcher, _ = make_prefetcher(store)
+    for context in ("2-abc", "4-def"):
+        prefetcher.schedule(RESULTS, owner="alice", context=context,
+                            build_draft=lambda question, results: [{"role": "user", "content": question}],
+                            complete_draft=lambda messages, max_tokens: (f"Draft ({max_tokens})", 30))
+    assert prefetcher.cache.take_draft("alice", "Why is the sky blue?", "2-abc") == "Draft (400)"
+    assert prefetcher.cache.take_draft("alice", "Why is the sky blue?", "4-def") == "Draft (400)"
+
+
+def test_truncated_drafts_are_paid_for_but_not_stored(store):
+    prefetcher, _ = make_prefetcher(store)
+    prefetcher.schedule(RESULTS, owner="alice",
+                        build_draft=lambda question, results: [{"role": "user", "content": question}],
+                        complete_draft=lambda messages, max_tokens: (None, max_tokens + 10))
+    assert not prefetcher.cache.has_draft("alice", "Why is the sky blue?")
+    stats = prefetcher.cache.metrics.snapshot()
+    assert stats["draft_tokens_spent"] == stats["wasted_draft_tokens"] == 2 * 410
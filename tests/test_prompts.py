@@ -0,0 +1,58 @@
+import types
+
+from prompts import STATIC_INSTRUCTIONS, build_messages, build_volatile_context, estimate_tokens, prompt_cache_usage
+
+HISTORY = [{"role": "user", "content": "first"},
+           {"role": "assistant", "content": "answer"},
+           {"role": "user", "content": "latest"}]
+
+SEARCH_RESULTS = {
+    "answer_box": {"title": "Title", "answer": "42", "source": "Example"},
+    "organic_results": [{"title": "Result", "snippet": "Snippet", "source": "example.com"}],
+}
+
+
+def test_build_messages_puts_static_prefix_first_and_volatile_context_last():
+    messages = build_messages(HISTORY, "alice", "2025-01-01", SEARCH_RESULTS)
+    assert messages[0] == {"role": "system", "content": STATIC_INSTRUCTIONS}
+    assert messages[1:-1] == HISTORY
+    assert messages[-1]["role"] == "system"
+    assert "alice" in messages[-1]["content"]
+    assert "2025-01-01" in messages[-1]["content"]
+    assert "FEATURED ANSWER: Title" in messages[-1]["content"]
+
+
+def test_prefix_is_stable_across_users_dates_and_searches():
+    first = build_messages(HISTORY[:1], "alice", "2025-01-01", SEARCH_RESULTS)
+    second = build_messages(HISTORY, "bob", "2025-01-02")
+    # Everything before the volatile context of the shorter request is shared
+    assert second[:len(first) - 1] == first[:-1]
+
+
+def test_build_messages_accepts_message_objects():
+    from session_memory import MessageLog
+
+    log = MessageLog(HISTORY, hot_messages=1)
+    assert build_messages(log, "alice", "2025-01-01")[1:-1] == HISTORY
+
+
+def test_volatile_context_without_search_results():
+    context = build_volatile_context("alice", "2025-01-01")
+    assert context == "Current context: you are talking to alice. Today's date is 2025-01-01."
+
+
+def test_estimate_tokens():
+    assert estimate_tokens([]) == 0
+    assert estimate_tokens([{"role": "user", "content": "x" * 40}]) == 14
+
+
+def test_prompt_cache_usage():
+    usage = types.SimpleNamespace(prompt_tokens=2000,
+                                  prompt_tokens_details=types.SimpleNamespace(cached_tokens=1500))
+    assert prompt_cache_usage(usage) == {"prompt_tokens": 2000, "cached_tokens": 1500, "cache_hit_ratio": 0.75}
+
+
+def test_prompt_cache_usage_without_details():
+    assert prompt_cache_usage(None) == {"prompt_tokens": 0, "cached_tokens": 0, "cache_hit_ratio": 0.0}
+    usage = types.SimpleNamespace(prompt_tokens=100, prompt_tokens_details=None)
+    assert prompt_cache_usage(usage)["cache_hit_ratio"] == 0.0
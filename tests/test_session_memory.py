@@ -0,0 +1,166 @@
+import os
+import stat
+
+from session_memory import Message, MessageLog, MemoryRegistry, TerminalBuffer
+
+LONG = "The search results show that the answer depends on the question. " * 10
+
+
+def contents(log):
+    return [message.content for message in log]
+
+
+def test_message_compresses_long_content():
+    message = Message("assistant", LONG)
+    before = message.nbytes()
+    assert message.compress() < 0
+    assert message.nbytes() < before
+    assert message.content == LONG
+    assert message["role"] == "assistant"
+    assert message.to_dict() == {"role": "assistant", "content": LONG}
+
+
+def test_message_keeps_short_content_plain():
+    message = Message("user", "hi")
+    assert message.compress() == 0
+    assert message.content == "hi"
+
+
+def test_messages_leaving_hot_window_are_compressed():
+    log = MessageLog(hot_messages=2)
+    for i in range(4):
+        log.append("assistant", f"{i} {LONG}")
+    packed = [message._packed is not None for message in log._messages]
+    assert packed == [True, True, False, False]
+    assert contents(log) == [f"{i} {LONG}" for i in range(4)]
+    assert log.nbytes == sum(message.nbytes() for message in log._messages)
+
+
+def test_last_returns_newest_message():
+    log = MessageLog(hot_messages=1)
+    assert log.last() is None
+    log.append("user", "first")
+    log.append("assistant", "second")
+    assert log.last().content == "second"
+
+
+def test_over_budget_history_is_dropped_without_offload_dir():
+    log = MessageLog(hot_messages=2, session_budget_bytes=1)
+    for i in range(5):
+        log.append("user", str(i))
+    assert contents(log) == ["3", "4"]
+    assert len(log) == 2
+
+
+def test_spilled_history_iterates_in_order(tmp_path):
+    log = MessageLog(hot_messages=2, session_budget_bytes=1, offload_dir=str(tmp_path))
+    for i in range(6):
+        log.append("user" if i % 2 == 0 else "assistant", f"{i} {LONG}")
+    assert len(log._messages) == 2
+    assert len(log) == 6
+    assert contents(log) == [f"{i} {LONG}" for i in range(6)]
+    assert [message.role for message in log] == ["user", "assistant"] * 3
+
+
+def test_iteration_is_a_consistent_snapshot_while_offloading(tmp_path):
+    log = MessageLog(hot_messages=1, session_budget_bytes=2 ** 62, offload_dir=str(tmp_path))
+    for i in range(4):
+        log.append("user", str(i))
+    log.offload_oldest()
+    history = iter(log)
+    first = next(history)
+    # Another session's enforce() may spill more while this iterator is open
+    log.offload_oldest()
+    assert [first.content] + [message.content for message in history] == ["0", "1", "2", "3"]
+
+
+def test_spill_files_are_private_and_removed_on_close(tmp_path):
+    offload_dir = tmp_path / "shared"
+    offload_dir.mkdir()
+    os.chmod(offload_dir, 0o777)
+    log = MessageLog(hot_messages=1, session_budget_bytes=1, offload_dir=str(offload_dir))
+    for i in range(3):
+        log.append("user", str(i))
+    (spill_dir,) = offload_dir.iterdir()
+    (spill_file,) = spill_dir.iterdir()
+    # The configured directory is left alone; the session gets a private one inside it
+    assert stat.S_IMODE(offload_dir.stat().st_mode) == 0o777
+    assert stat.S_IMODE(spill_dir.stat().st_mode) == 0o700
+    assert stat.S_IMODE(spill_file.stat().st_mode) == 0o600
+
+    log.close()
+    assert list(offload_dir.iterdir()) == []
+    assert len(log) == 0 and log.nbytes == 0
+
+
+def test_unwritable_offload_dir_drops_messages(tmp_path):
+    not_a_dir = tmp_path / "file"
+    not_a_dir.write_text("")
+    log = MessageLog(hot_messages=1, session_budget_bytes=1, offload_dir=str(not_a_dir))
+    for i in range(3):
+        log.append("user", str(i))
+    assert contents(log) == ["2"]
+    assert log.offload_dir is None
+
+
+def test_registry_tracks_and_forgets_sessions():
+    registry = MemoryRegistry()
+    log = MessageLog(registry=registry)
+    log.append("user", LONG)
+    assert registry.total_bytes == log.nbytes > 0
+    del log
+    assert registry.total_bytes == 0
+
+
+def test_registry_falls_through_to_sessions_that_can_offload():
+    registry = MemoryRegistry(global_budget_bytes=30000)
+    small = MessageLog(hot_messages=2, session_budget_bytes=2 ** 62, registry=registry)
+    for _ in range(30):
+        small.append("user", "x" * 50)
+    large = MessageLog(hot_messages=8, session_budget_bytes=2 ** 62, registry=registry)
+    for _ in range(8):
+        large.append("assistant", "y" * 5000)
+    # The largest session holds only hot messages, so the small one gives up its cold ones
+    assert len(small._messages) == 2
+    assert len(large._messages) == 8
+
+
+def test_registry_gives_up_at_once_when_only_hot_messages_are_left(monkeypatch):
+    registry = MemoryRegistry(global_budget_bytes=1000)
+    logs = [MessageLog(hot_messages=4, session_budget_bytes=2 ** 62, registry=registry) for _ in range(3)]
+    for log in logs:
+        for _ in range(3):
+            log.append("user", "x" * 500)
+    assert registry.cold_messages == 0
+    calls = []
+    original = MessageLog.offload_oldest
+    monkeypatch.setattr(MessageLog, "offload_oldest", lambda self: calls.append(self) or original(self))
+    logs[0].append("user", "x" * 500)
+    # The budget is soft: nothing is cold, so only the growing session is asked
+    assert calls == [logs[0]]
+    assert registry.total_bytes > registry.global_budget_bytes
+
+    logs[0].append("user", "x" * 500)
+    assert registry.cold_messages == 0
+    assert len(logs[0]._messages) == 4
+
+
+def test_registry_offloads_growing_session_first():
+    registry = MemoryRegistry(global_budget_bytes=20000)
+    idle = MessageLog(hot_messages=1, session_budget_bytes=2 ** 62, registry=registry)
+    for i in range(10):
+        idle.append("user", f"{i} " + "x" * 1000)
+    growing = MessageLog(hot_messages=1, session_budget_bytes=2 ** 62, registry=registry)
+    for i in range(30):
+        growing.append("user", f"{i} " + "y" * 1000)
+    assert len(idle._messages) == 10
+    assert registry.total_bytes <= registry.global_budget_bytes
+
+
+def test_terminal_buffer_keeps_newest_lines():
+    terminal = TerminalBuffer(["a", "b"], max_lines=3)
+    for line in ("c", "d"):
+        terminal.append(line)
+    assert list(terminal) == ["b", "c", "d"]
+    terminal.clear()
+    assert len(terminal) == 0
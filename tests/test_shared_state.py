@@ -0,0 +1,138 @@
+import time
+
+import pytest
+
+from shared_state import InProcessStore, ConversationStore, RateLimiter, SessionTokens, connect
+
+
+def test_set_get_delete(store):
+    assert store.get("a") is None
+    assert store.set("a", 1)
+    assert store.get("a") == "1"
+    assert store.mget(["a", "missing"]) == ["1", None]
+    assert store.delete("a", "missing") == 1
+    assert store.get("a") is None
+
+
+def test_set_nx_only_writes_missing_keys(store):
+    assert store.set("claim", "first", nx=True)
+    assert not store.set("claim", "second", nx=True)
+    assert store.get("claim") == "first"
+
+
+def test_pipeline_returns_results_in_order(store):
+    pipe = store.pipeline()
+    pipe.set("a", "1")
+    pipe.incrby("counter", 5)
+    pipe.get("a")
+    pipe.delete("a")
+    assert pipe.execute() == [True, 5, "1", 1]
+    assert store.get("a") is None
+
+
+def test_list_commands(store):
+    assert store.rpush("list", "a", "b", "c") == 3
+    assert store.lrange("list", 0, -1) == ["a", "b", "c"]
+    assert store.lrange("list", 1, 1) == ["b"]
+    store.ltrim("list", -2, -1)
+    assert store.lrange("list", 0, -1) == ["b", "c"]
+    assert store.lrange("missing", 0, -1) == []
+
+
+def test_expired_keys_are_not_returned():
+    store = InProcessStore()
+    store.set("a", "1", ex=0.01)
+    store.rpush("list", "x")
+    store.expire("list", 0.01)
+    time.sleep(0.02)
+    assert store.get("a") is None
+    assert store.lrange("list", 0, -1) == []
+
+
+def test_expired_keys_are_swept_without_being_read():
+    store = InProcessStore()
+    for i in range(10):
+        store.set(f"key:{i}", "1", ex=0.01)
+    store.set("kept", "1")
+    time.sleep(0.02)
+    # Any command sweeps expired keys, not just reads of those keys
+    store.get("kept")
+    assert set(store._data) == {"kept"}
+    assert store._expires == {}
+
+
+def test_set_without_expiry_clears_previous_expiry():
+    store = InProcessStore()
+    store.set("a", "1", ex=0.01)
+    store.set("a", "2")
+    time.sleep(0.02)
+    assert store.get("a") == "2"
+
+
+def test_connect_defaults_to_in_process_store():
+    assert isinstance(connect(None), InProcessStore)
+    assert isinstance(connect("memory://"), InProcessStore)
+
+
+def test_rate_limiter_rolls_back_rejected_requests(store):
+    limiter = RateLimiter(store, "test", limit=10)
+    assert limiter.try_acquire(6)
+    assert not limiter.try_acquire(5)
+    # The rejected request reserved nothing, so the rest still fits
+    assert limiter.used() == 6
+    assert limiter.try_acquire(4)
+    assert not limiter.try_acquire(1)
+    assert limiter.used() == 10
+
+
+def test_rate_limiter_charge_can_refund(store):
+    limiter = RateLimiter(store, "test", limit=10)
+    assert limiter.try_acquire(8)
+    limiter.charge(-5)
+    assert limiter.used() == 3
+    limiter.charge(20)
+    assert limiter.used() == 23
+    assert not limiter.try_acquire(1)
+
+
+def test_session_tokens_round_trip():
+    tokens = SessionTokens("secret")
+    session_id, token = tokens.issue()
+    assert tokens.verify(token) == session_id
+    assert SessionTokens("other secret").verify(token) is None
+
+
+@pytest.mark.parametrize("token", [None, "", "abc", "0" * 32, "0" * 32 + "." + "0" * 32,
+                                   "../../etc" + "." + "0" * 32])
+def test_session_tokens_reject_malformed_or_unsigned(token):
+    assert SessionTokens("secret").verify(token) is None
+
+
+def test_session_tokens_reject_tampered_id():
+    tokens = SessionTokens("secret")
+    session_id, token = tokens.issue()
+    forged = ("1" if session_id[0] != "1" else "2") + token[1:]
+    assert tokens.verify(forged) is None
+
+
+def test_conversation_store_appends_and_loads(store):
+    conversation = ConversationStore(store)
+    assert conversation.load("s1") == {}
+    conversation.set_username("s1", "alice")
+    conversation.append_messages("s1", {"role": "user", "content": "hi"})
+    conversation.append_messages("s1", {"role": "assistant", "content": "hello"})
+    conversation.append_terminal("s1", ["$ ls", "app.py", "$ date", "today"], max_lines=3)
+    assert conversation.load("s1") == {
+        "username": "alice",
+        "messages": [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}],
+        "terminal_history": ["app.py", "$ date", "today"],
+    }
+    assert conversation.load("s2") == {}
+
+
+def test_conversation_store_reset(store):
+    conversation = ConversationStore(store)
+    conversation.set_username("s1", "alice")
+    conversation.append_messages("s1", {"role": "user", "content": "hi"})
+    conversation.reset("s1", "username", "messages")
+    assert conversation.load("s1") == {}